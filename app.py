@@ -4,50 +4,166 @@ from flask import (
     Flask, render_template,
     request, url_for, jsonify, redirect
 )
+import atexit
+import hmac
 import json
+import importlib
 import io
 import os
+import threading
 from data_access.data_access import DataAccess
-from ratings.groupings import Group, GroupResult, Player, Match, make_groups
-from ratings.ratings import bttc_algorithm
+from data_access.multi_league import LeagueDataAccess, MULTI_SCHEMA_PATH
+from data_access.search import PlayerNameIndex, RatingIndex
+from events import Broadcaster
+from profiling import Sampler
+from ratings.groupings import Group, GroupResult, Player, make_groups
+from ratings.ratings import get_rating_model
+from ratings.standings import GroupStandings, StandingsCache
+from ratings.ledger import LedgerCache, ProvisionalRatings
 from wtforms import (
     Form, BooleanField, StringField, 
     PasswordField, IntegerField, validators, FieldList, FormField)
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
-from matplotlib.pylab import plt
-from matplotlib.ticker import (
-    MultipleLocator
-)
 import time
 
 app = Flask(__name__)
 app.secret_key = 'some secret key'
+# which rules session_results rates matches with (see ratings.RATING_MODELS)
+app.config['RATING_MODEL'] = os.environ.get('RATING_MODEL', 'bttc')
+# sampling profiler: on for every request with PROFILE=1, or per request for
+# admins sending an X-Profile header that matches PROFILE_TOKEN
+app.config['PROFILE'] = os.environ.get('PROFILE') == '1'
+app.config['PROFILE_TOKEN'] = os.environ.get('PROFILE_TOKEN')
+# open scoreboard streams allowed at once. each holds a worker thread, so keep
+# this well under GUNICORN_THREADS to leave threads for normal requests
+app.config['MAX_STREAMS'] = int(os.environ.get('MAX_STREAMS', 16))
+# one shared database for every league instead of data/<league>.db files
+# (see data_access/multi_league.py)
+app.config['LEAGUES_DB'] = os.environ.get('LEAGUES_DB')
 
 app_dir = os.path.dirname(os.path.abspath(__file__))
 DATABASE_DIR = os.path.join(app_dir, 'data')
 SCHEMA_PATH = os.path.join(app_dir, 'data_access/schema.sql')
+PROFILE_DIR = os.path.join(app_dir, 'profiles')
+
+# slow imports that only a couple of views need. they are loaded on first
+# use (see lazy_import) or up front in the gunicorn master (gunicorn.conf.py)
+HEAVY_MODULES = [
+    'numpy',
+    'matplotlib.figure',
+    'matplotlib.ticker',
+    'matplotlib.backends.backend_agg',
+    'k_means_constrained',
+]
+
+def lazy_import(name):
+    return importlib.import_module(name)
+
+def warm_imports():
+    for name in HEAVY_MODULES:
+        lazy_import(name)
+
+# group standings per (league, session, group), patched as scores come in
+standings_cache = StandingsCache()
+# provisional rating changes per (league, session)
+ledger_cache = LedgerCache()
+# typeahead name index per league, built on first search
+name_indexes = {}
+# players sorted by rating per league, for challenge match suggestions
+rating_indexes = {}
+# rows per page for the keyset paginated lists
+PAGE_SIZE = 20
+# live scoreboard updates, one channel per (league, session)
+scoreboard = Broadcaster(max_streams=app.config['MAX_STREAMS'])
+# how long a client turned away by the stream limit waits before retrying
+STREAM_RETRY_SECONDS = 30
+
+# open connections kept per thread between requests, so sqlite's per
+# connection statement cache keeps the catalog queries compiled
+_connections = threading.local()
 
 def get_db(db_name):
-    db = getattr(g, '_database', None)
-    db_path = os.path.join(DATABASE_DIR, db_name)
+    if app.config['LEAGUES_DB']:
+        return get_league_db(db_name)
+    dbs = getattr(_connections, 'files', None)
+    if dbs is None:
+        dbs = _connections.files = {}
+    db = dbs.get(db_name)
     if db is None:
-        db = DataAccess(db_path)
+        db = DataAccess(os.path.join(DATABASE_DIR, db_name))
         db.connect()
-        g._database = db
-    # check if we are switching leagues
-    elif db.db_path != db_path:
-        # close the old conn and switch
-        db.close()
-        db = DataAccess(db_path)
+        dbs[db_name] = db
+    g._database = db
+    return db
+
+def get_league_db(league):
+    # one connection per thread for every league, switching league just
+    # repoints its views (see LeagueDataAccess.use_league)
+    db = getattr(_connections, 'leagues', None)
+    if db is None:
+        db = _connections.leagues = LeagueDataAccess(app.config['LEAGUES_DB'], league)
         db.connect()
-        g._database = db
+    elif db.league != league:
+        db.use_league(league)
+    g._database = db
     return db
 
+def get_name_index(db, league):
+    index = name_indexes.get(league)
+    if index is None:
+        index = PlayerNameIndex.from_rows(db.get_player_names())
+        name_indexes.setdefault(league, index)
+    return name_indexes[league]
+
+def get_rating_index(db, league):
+    index = rating_indexes.get(league)
+    if index is None:
+        index = RatingIndex.from_rows(db.get_player_ratings())
+        rating_indexes.setdefault(league, index)
+    return rating_indexes[league]
+
+def load_ledger(db, session_id):
+    start_ratings = {r['player_id']: r['rating'] for r in db.get_session_start_ratings(session_id)}
+    return ProvisionalRatings.from_match_rows(
+        get_rating_model(app.config['RATING_MODEL']),
+        start_ratings,
+        db.get_match_results(session_id)
+    )
+
+def get_ledger(db, league, session_id):
+    # cached, for previews only: anything saved is computed from fresh rows
+    return ledger_cache.get(league, session_id, lambda: load_ledger(db, session_id))
+
+profiler = Sampler(PROFILE_DIR)
+atexit.register(profiler.flush)
+
+@app.before_request
+def start_profiling():
+    # keep the disabled path to a couple of lookups, it runs on every request
+    if not app.config['PROFILE']:
+        token = app.config['PROFILE_TOKEN']
+        if not token:
+            return
+        # environ directly, request.headers builds a headers object first
+        header = request.environ.get('HTTP_X_PROFILE')
+        # constant time compare, the token is an admin credential
+        if header is None or not hmac.compare_digest(header.encode(), token.encode()):
+            return
+    route = request.url_rule.rule if request.url_rule is not None else request.path
+    profiler.start_request(route)
+
+@app.teardown_request
+def stop_profiling(exception):
+    # asks the profiler (a dict lookup) rather than g, one less proxy lookup
+    if profiler.is_profiling():
+        profiler.end_request()
+
 @app.teardown_appcontext
 def close_connection(exception):
+    # the connection stays open for the thread's next request, just make
+    # sure a failed request doesn't leave a transaction behind
     db = getattr(g, '_database', None)
-    if db is not None:
-        db.close()
+    if db is not None and db.conn.in_transaction:
+        db.conn.rollback()
 
 class LeagueForm(Form):
     league_name = StringField('League Name', [validators.Length(min=4, max=25)])
@@ -75,13 +191,16 @@ def create_league():
         league_name = form.league_name.data
         db_name = league_name.lower().strip().replace(' ', '_') + '.db'
         db = get_db(db_name)
-        db.init_db(SCHEMA_PATH)
+        db.init_db(MULTI_SCHEMA_PATH if app.config['LEAGUES_DB'] else SCHEMA_PATH)
         return redirect(url_for('choose_league'))
     return render_template('new_league.html', form=form)
 
 @app.route('/leagues', methods=['GET', 'POST'])
 def choose_league():
-    leagues = [f for f in os.listdir(DATABASE_DIR) if not f.startswith('.')]
+    if app.config['LEAGUES_DB']:
+        leagues = get_league_db(None).get_leagues()
+    else:
+        leagues = [f for f in os.listdir(DATABASE_DIR) if not f.startswith('.')]
     if request.method == 'POST':
         league = request.form.get('league')
         db = get_db(league)
@@ -91,13 +210,71 @@ def choose_league():
 @app.route('/leagues/<league>', methods=['GET', 'POST'])
 def league_view(league):
     db = get_db(league)
-    players = db.get_players()
-    sessions = db.get_sessions()
-    print('got sessions: {}'.format(sessions))
+    # first page only, the rest comes from player_search / older session pages
+    players = db.get_players_page(limit=PAGE_SIZE)
+    before = request.args.get('before', type=int)
+    sessions = db.get_sessions_page(before_session_id=before, limit=PAGE_SIZE)
+    older = sessions[-1]['session_id'] if len(sessions) == PAGE_SIZE else None
     if request.method == 'POST':
         player_id = int(request.form.get('player'))
         return redirect(url_for('player_view', league=league, player_id=player_id))
-    return render_template('league_home.html', players=players, league=league, sessions=sessions)
+    return render_template(
+        'league_home.html', players=players, league=league, sessions=sessions, older=older)
+
+@app.route('/leagues/<league>/players/search', methods=['GET'])
+def player_search(league):
+    db = get_db(league)
+    query = request.args.get('q', '')
+    limit = min(request.args.get('limit', PAGE_SIZE, type=int), 100)
+    player_ids = get_name_index(db, league).search(query, limit=limit)
+    players = {p['player_id']: p.to_dict() for p in db.get_players_by_ids(player_ids)}
+    # players added by another worker since the index was built won't be found
+    return jsonify([players[pid] for pid in player_ids if pid in players])
+
+@app.route('/leagues/<league>/players.json', methods=['GET'])
+def players_page(league):
+    db = get_db(league)
+    after_name = request.args.get('after_name')
+    after_id = request.args.get('after_id', type=int)
+    after = (after_name, after_id) if after_name is not None and after_id is not None else None
+    players = db.get_players_page(after=after, limit=PAGE_SIZE)
+    next_page = None
+    if len(players) == PAGE_SIZE:
+        last = players[-1]
+        next_page = url_for(
+            'players_page', league=league, after_name=last['name'], after_id=last['player_id'])
+    return jsonify({'players': [p.to_dict() for p in players], 'next': next_page})
+
+@app.route('/leagues/<league>/sessions.json', methods=['GET'])
+def sessions_page(league):
+    db = get_db(league)
+    before = request.args.get('before', type=int)
+    sessions = db.get_sessions_page(before_session_id=before, limit=PAGE_SIZE)
+    next_page = None
+    if len(sessions) == PAGE_SIZE:
+        next_page = url_for('sessions_page', league=league, before=sessions[-1]['session_id'])
+    return jsonify({'sessions': [s.to_dict() for s in sessions], 'next': next_page})
+
+@app.route('/leagues/<league>/player/<player_id>/matches.json', methods=['GET'])
+def player_matches_page(league, player_id):
+    db = get_db(league)
+    before_session = request.args.get('before_session', type=int)
+    before_opponent = request.args.get('before_opponent', type=int)
+    before = None
+    if before_session is not None and before_opponent is not None:
+        before = (before_session, before_opponent)
+    matches = db.get_matches_by_player_page(player_id, before=before, limit=PAGE_SIZE)
+    next_page = None
+    if len(matches) == PAGE_SIZE:
+        last = matches[-1]
+        next_page = url_for(
+            'player_matches_page',
+            league=league,
+            player_id=player_id,
+            before_session=last['session_id'],
+            before_opponent=last['player_2_id']
+        )
+    return jsonify({'matches': [m.to_dict() for m in matches], 'next': next_page})
 
 @app.route('/leagues/<league>/player', methods=['GET', 'POST'])
 def create_player(league):
@@ -107,6 +284,10 @@ def create_player(league):
         player_name = form.player_name.data
         rating = form.rating.data
         player_id = db.add_player(player_name=player_name, rating=rating)
+        if league in name_indexes:
+            name_indexes[league].add(player_id, player_name)
+        if league in rating_indexes:
+            rating_indexes[league].update(player_id, rating)
         return redirect(url_for('league_view', league=league))
     return render_template('new_player.html', form=form)
 
@@ -125,11 +306,13 @@ def add_session(league):
 def add_players_to_session(league, session_id):
     db = get_db(league)
     #form = SessionForm(request.form)
-    players = db.get_players()
+    players = db.get_players_page(limit=PAGE_SIZE)
     selected_players = db.get_players_by_session_id(session_id)
     if request.method == 'POST':
         player_id = int(request.form.get('player'))
         db.add_session_to_player(session_id, player_id)
+        standings_cache.invalidate(league, session_id)
+        ledger_cache.invalidate(league, session_id)
         return redirect(
             url_for('add_players_to_session', league=league, session_id=session_id))
     return render_template(
@@ -146,6 +329,7 @@ def edit_groups(league, session_id):
     form = GroupForm(request.form)
     players = db.get_players_by_session_id(session_id)
     groups = []
+    forecasts = {}
     if request.method == 'POST':
         min_group_size = form.min_group_size.data
         max_group_size = form.max_group_size.data
@@ -160,9 +344,21 @@ def edit_groups(league, session_id):
         for group in groups:
             for player in group.players:
                 db.update_player_group(session_id, player.player_id, group.group_number)
+        standings_cache.invalidate(league, session_id)
+        ledger_cache.invalidate(league, session_id)
+        # odds of winning the group / expected rating change (numpy, so loaded lazily)
+        forecast_group = lazy_import('ratings.forecast').forecast_group
+        for group in groups:
+            forecasts[group.group_number] = forecast_group(group, app.config['RATING_MODEL'])
         # return render_template('group_edit.html', form=form, groups=groups)
     return render_template(
-        'group_edit.html', form=form, groups=groups, league=league, session_id=session_id)
+        'group_edit.html',
+        form=form,
+        groups=groups,
+        forecasts=forecasts,
+        league=league,
+        session_id=session_id
+    )
 
 @app.route('/leagues/<league>/session/<session_id>/groups/input', methods=['GET', 'POST'])
 def match_edit(league, session_id):
@@ -190,9 +386,21 @@ def match_edit(league, session_id):
         match_rows = db.get_matches_by_group(session_id, g.group_number)
         group_result = GroupResult.from_match_rows(g.group_number, match_rows)
         group_result.players = g.players
+        group_result.standings = standings_cache.get(
+            league, session_id, g.group_number,
+            lambda: GroupStandings.from_matches(group_result.group_number, group_result.matches)
+        )
         group_results.append(group_result)
 
-    return render_template('groups.html', group_results=group_results, session_id=session_id, league=league)
+    ledger = get_ledger(db, league, session_id)
+    return render_template(
+        'groups.html',
+        group_results=group_results,
+        provisional_ratings=ledger.ratings(),
+        session_id=session_id,
+        stream_retry_seconds=STREAM_RETRY_SECONDS,
+        league=league
+    )
 
 @app.route('/leagues/<league>/session/<session_id>/groups/input/<player_id1>/<player_id2>', methods=['GET', 'POST'])
 def save_match_score(league, session_id, player_id1, player_id2):
@@ -203,98 +411,225 @@ def save_match_score(league, session_id, player_id1, player_id2):
     if request.method == 'POST' and form.validate():
         p1_wins = form.p1_wins.data
         p2_wins = form.p2_wins.data
+        # stale or hand edited url for a pair with no match: nothing to save
+        if not db.get_match(session_id, player_id1, player_id2):
+            return redirect(url_for('match_edit', league=league, session_id=session_id))
+        # a correction to a finalized session reopens it (and drops its cached results)
+        if db.is_session_finalized(session_id):
+            db.reopen_session(session_id)
         db.update_match(player_id1, player_id2, session_id, p1_wins=p1_wins, p2_wins=p2_wins)
+        match_row = db.get_match_detail(session_id, player_id1, player_id2)
+        group_number = match_row['group_number']
+        standings_cache.record_result(
+            league, session_id, group_number,
+            player_id1, player_id2, p1_wins, p2_wins
+        )
+        ledger_cache.record_result(league, session_id, player_id1, player_id2, p1_wins, p2_wins)
+        publish_match_update(db, league, session_id, match_row)
         return redirect(url_for('match_edit', league=league, session_id=session_id))
     return render_template('match.html', form=form, player1=player1, player2=player2)
 
-@app.route('/leagues/<league>/session/<session_id>/results', methods=['GET', 'POST'])
-def session_results(league, session_id):
+def publish_match_update(db, league, session_id, match_row):
+    channel = (league, int(session_id))
+    if not scoreboard.has_subscribers(channel):
+        return
+    group_number = match_row['group_number']
+    ledger = get_ledger(db, league, session_id)
+    # normally already cached (record_result just patched it), only a cold
+    # cache costs the extra group query
+    standings = standings_cache.get(
+        league, session_id, group_number,
+        lambda: GroupStandings.from_matches(
+            group_number,
+            GroupResult.from_match_rows(
+                group_number, db.get_matches_by_group(session_id, group_number)).matches
+        )
+    )
+    scoreboard.publish(channel, 'match', {
+        'group_number': group_number,
+        'match': {
+            'player_1_id': match_row['player_1_id'],
+            'player_2_id': match_row['player_2_id'],
+            'player_1_wins': match_row['player_1_wins'],
+            'player_2_wins': match_row['player_2_wins'],
+        },
+        'standings': [s.to_dict() for s in standings.ranking()],
+        'provisional_ratings': {
+            pid: ledger.rating(pid)
+            for pid in (match_row['player_1_id'], match_row['player_2_id'])
+        },
+    })
+
+@app.route('/leagues/<league>/session/<session_id>/groups/stream', methods=['GET'])
+def scoreboard_stream(league, session_id):
+    events = scoreboard.stream((league, int(session_id)))
+    if events is None:
+        # every stream slot is taken, the page still works without live updates
+        return Response(
+            'retry: {}\n\n'.format(STREAM_RETRY_SECONDS * 1000),
+            status=503,
+            mimetype='text/event-stream',
+            headers={'Retry-After': str(STREAM_RETRY_SECONDS)}
+        )
+    return Response(
+        events,
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def compute_session_results(db, league, session_id, save=False):
+    '''
+    rating changes and standings for every group in the session, written
+    to the rating / player tables when save is set. a finalized session
+    shows the ratings that were saved, not a recompute with today's model
+
+    returns:
+        (session_date, list of GroupResult with players carrying
+         previous_rating / new_rating)
+    '''
     # eventually will render things like ranking-pre ranking-post
     # group winners etc.
-    db = get_db(league)
-    # for some of this should only do on POST
-    match_records = db.get_match_results(session_id)
     session_date = db.get_session_date(session_id)
-    # calculate the total rating change per player
-    # TODO: should probably encapsulate this logic somewhere else
-    # what if rules like "bonus points" need to be added?
-    player_ratings = {}
-    for m in match_records:
-        # player1
-        # player2
-        # p1_wins
-        # p2_wins
-        match = Match.from_match_row(m)
-        # calculate rating change and update player's ratings for the session
-        # a1 = bttc_algorithm(rating1, player_1_wins, rating2, player_2_wins)
-        ratings1 = db.get_player_rating_by_session(session_id, match.player1.player_id)
-        if ratings1 is not None:
-            r1 = ratings1['previous_rating']
+    saved = {}
+    if not save and db.is_session_finalized(session_id):
+        saved = {r['player_id']: r for r in db.get_session_ratings(session_id)}
+    # the caches only see writes made through this process, so what gets
+    # saved is rebuilt from the rows as they are now
+    if save:
+        ledger = load_ledger(db, session_id)
+    else:
+        ledger = get_ledger(db, league, session_id)
+    group_results = []
+    group_winners = set()
+    num_groups = db.get_group_count(session_id)
+    for n in range(num_groups):
+        group_number = n + 1
+        match_rows = db.get_matches_by_group(session_id, group_number)
+        group_result = GroupResult.from_match_rows(group_number, match_rows)
+        if save:
+            group_result.standings = GroupStandings.from_matches(group_number, group_result.matches)
         else:
-            r1 = match.player1.rating
+            group_result.standings = standings_cache.get(
+                league, session_id, group_number,
+                lambda: GroupStandings.from_matches(group_result.group_number, group_result.matches)
+            )
+        if group_result.standings.winner is not None:
+            group_winners.add(group_result.standings.winner)
+        group_results.append(group_result)
+    if saved:
+        group_winners = set(pid for pid, r in saved.items() if r['won_group'])
 
-        ratings2 = db.get_player_rating_by_session(session_id, match.player2.player_id)
-        if ratings2 is not None:
-            r2 = ratings2['previous_rating']
-        else:
-            r2 = match.player2.rating
-        # initialize these with the starting rating for this session
-        if match.player1.player_id not in player_ratings:
-            player_ratings[match.player1.player_id] = r1
-        if match.player2.player_id not in player_ratings:
-            player_ratings[match.player2.player_id] = r2
-
-        w1 = match.p1_wins
-        w2 = match.p2_wins
-        p1_adjustment = bttc_algorithm(r1, w1, r2, w2)
-        p2_adjustment = bttc_algorithm(r2, w2, r1, w1)
-        # add the adjustment to the ongoing rating tally for this player
-        player_ratings[match.player1.player_id] += p1_adjustment
-        player_ratings[match.player2.player_id] += p2_adjustment
-        # add the new ratings for each player
     rating_change = {}
-    for player_id, new_rating in player_ratings.items():
-        p = db.get_player(player_id)
-        player = Player.from_player_row(p)
-
-        rating_pair = db.get_player_rating_by_session(session_id, player_id)
-        if rating_pair is not None:
-            previous_rating = rating_pair['previous_rating']
-        else:
-            previous_rating = player.rating
+    for player_id, new_rating in ledger.ratings().items():
+        previous_rating = ledger.start_ratings[player_id]
+        if player_id in saved:
+            previous_rating = saved[player_id]['previous_rating']
+            new_rating = saved[player_id]['rating']
         # make a lookup of previous and new rating for session
         rating_change[player_id] = {}
         rating_change[player_id]['previous_rating'] = previous_rating
         rating_change[player_id]['new_rating'] = new_rating
 
-        if request.method == 'POST':
+        if save:
             db.add_rating(
                 player_id=player_id, 
                 session_id=session_id, 
                 previous_rating=previous_rating, 
-                rating=new_rating
+                rating=new_rating,
+                won_group=int(player_id in group_winners)
             )
+            # re-saving an older session mustn't undo what later ones did
+            if db.has_later_rating(player_id, session_id):
+                continue
             db.update_player_rating(player_id=player_id, rating=new_rating)
+            if league in rating_indexes:
+                rating_indexes[league].update(player_id, new_rating)
 
-    group_results = []
-    num_groups = db.get_group_count(session_id)
-    for n in range(num_groups):
-        group_number = n + 1
-        match_rows = db.get_matches_by_group(session_id, group_number)
-        group_result = GroupResult.from_match_rows(group_number, match_rows)
-        player_rows = db.get_players_by_group(session_id, group_number)
+    if save:
+        # the cached copies may be the stale ones, let previews reload too
+        standings_cache.invalidate(league, session_id)
+        ledger_cache.invalidate(league, session_id)
+
+    for group_result in group_results:
+        player_rows = db.get_players_by_group(session_id, group_result.group_number)
         players = [Player.from_player_row(p) for p in player_rows]
         for p in players:
             p.new_rating = rating_change[p.player_id]['new_rating']
             p.previous_rating = rating_change[p.player_id]['previous_rating']
+            if p.player_id in group_winners:
+                p.won_group_number = group_result.group_number
         group_result.players = players
-        group_results.append(group_result)
 
-    return render_template(
+    return session_date, group_results
+
+def session_results_data(session_id, session_date, group_results):
+    return {
+        'session_id': int(session_id),
+        'session_date': session_date,
+        'groups': [
+            {
+                'group_number': g.group_number,
+                'players': [
+                    {
+                        'player_id': p.player_id,
+                        'name': p.name,
+                        'previous_rating': p.previous_rating,
+                        'new_rating': p.new_rating,
+                        'won_group': bool(p.won_group_number),
+                    }
+                    for p in g.players
+                ],
+                'matches': [
+                    {
+                        'player_1_id': m.player1.player_id,
+                        'player_2_id': m.player2.player_id,
+                        'player_1_wins': m.p1_wins,
+                        'player_2_wins': m.p2_wins,
+                    }
+                    for m in g.matches
+                ],
+            }
+            for g in group_results
+        ],
+    }
+
+@app.route('/leagues/<league>/session/<session_id>/results', methods=['GET', 'POST'])
+def session_results(league, session_id):
+    db = get_db(league)
+    # finalized sessions don't change, serve what was rendered when they were saved
+    if request.method == 'GET':
+        cached = db.get_session_cache(session_id, 'results.html')
+        if cached is not None:
+            return cached
+
+    save = request.method == 'POST'
+    session_date, group_results = compute_session_results(db, league, session_id, save=save)
+    html = render_template(
         'session_results.html', 
         group_results=group_results, 
         league=league, 
+        session_id=session_id,
         session_date=session_date)
+    # finalized but not cached yet covers sessions saved before the cache existed
+    if save or db.is_session_finalized(session_id):
+        data = session_results_data(session_id, session_date, group_results)
+        db.finalize_session(session_id, {
+            'results.html': html,
+            'results.json': json.dumps(data),
+        })
+    return html
+
+@app.route('/leagues/<league>/session/<session_id>/results.json', methods=['GET'])
+def session_results_json(league, session_id):
+    db = get_db(league)
+    cached = db.get_session_cache(session_id, 'results.json')
+    if cached is None:
+        session_date, group_results = compute_session_results(db, league, session_id)
+        cached = json.dumps(session_results_data(session_id, session_date, group_results))
+        if db.is_session_finalized(session_id):
+            db.finalize_session(session_id, {'results.json': cached})
+    return Response(cached, mimetype='application/json')
+
 
 @app.route('/leagues/<league>/player/<player_id>', methods=['GET'])
 def player_view(league, player_id):
@@ -302,10 +637,29 @@ def player_view(league, player_id):
     player = db.get_player(player_id)
     return render_template('player.html', league=league, player=player)
 
+#### CHALLENGE MATCH SUGGESTIONS
+
+@app.route('/leagues/<league>/player/<player_id>/challengers.json', methods=['GET'])
+def suggest_challengers(league, player_id):
+    db = get_db(league)
+    player_id = int(player_id)
+    # clamped: a negative sqlite limit means no limit at all
+    k = max(0, min(request.args.get('k', 5, type=int), 50))
+    recent_sessions = max(0, min(request.args.get('recent_sessions', 4, type=int), 52))
+    # skip anyone they've already played lately
+    exclude = set(db.get_recent_opponents(player_id, recent_sessions))
+    exclude.add(player_id)
+    nearest = get_rating_index(db, league).nearest(player_id, k=k, exclude=exclude)
+    players = {p['player_id']: p.to_dict() for p in db.get_players_by_ids([pid for pid, _ in nearest])}
+    return jsonify([players[pid] for pid, _ in nearest if pid in players])
+
 #### GRAPHING PLAYER RATING OVER TIME
 
 def plot_player_history(name, sessions, ratings):
-    fig = plt.figure(figsize=(20,5))
+    # Figure directly rather than pyplot so nothing is kept in pyplot's global state
+    Figure = lazy_import('matplotlib.figure').Figure
+    MultipleLocator = lazy_import('matplotlib.ticker').MultipleLocator
+    fig = Figure(figsize=(20,5))
     ax = fig.add_subplot(1, 1, 1)
     ax.plot(sessions, ratings, label=name)
     ax.legend(loc='upper left')
@@ -321,9 +675,85 @@ def graph_ratings(league, player_id):
     sessions = [r['session_date'] for r in ratings_by_session]
     fig = plot_player_history(player['name'], sessions, ratings)
     output = io.BytesIO()
+    FigureCanvas = lazy_import('matplotlib.backends.backend_agg').FigureCanvasAgg
+    FigureCanvas(fig).print_png(output)
+    return Response(output.getvalue(), mimetype='image/png')
+
+def rating_series(history_rows):
+    '''
+    lines up several players' rating histories on one axis of sessions.
+    a player's rating carries forward through sessions they sat out, and
+    is None before their first session
+
+    returns:
+        (list of {session_id, session_date}, list of {player_id, name, ratings})
+    '''
+    sessions = []
+    positions = {}
+    names = {}
+    for r in history_rows:
+        if r['session_id'] not in positions:
+            positions[r['session_id']] = len(sessions)
+            sessions.append({'session_id': r['session_id'], 'session_date': r['session_date']})
+        names[r['player_id']] = r['name']
+
+    ratings = {player_id: [None] * len(sessions) for player_id in names}
+    for r in history_rows:
+        ratings[r['player_id']][positions[r['session_id']]] = r['rating']
+    for player_ratings in ratings.values():
+        for i in range(1, len(player_ratings)):
+            if player_ratings[i] is None:
+                player_ratings[i] = player_ratings[i - 1]
+
+    series = [
+        {'player_id': player_id, 'name': names[player_id], 'ratings': ratings[player_id]}
+        for player_id in names
+    ]
+    return sessions, series
+
+def plot_rating_comparison(sessions, series):
+    Figure = lazy_import('matplotlib.figure').Figure
+    fig = Figure(figsize=(20,5))
+    ax = fig.add_subplot(1, 1, 1)
+    x = list(range(len(sessions)))
+    for s in series:
+        # None -> nan so matplotlib leaves a gap before a player's first session
+        ratings = [float('nan') if r is None else r for r in s['ratings']]
+        ax.plot(x, ratings, label=s['name'])
+    step = max(1, len(sessions) // 20)
+    ax.set_xticks(x[::step])
+    ax.set_xticklabels([s['session_date'] for s in sessions][::step])
+    ax.legend(loc='upper left')
+    return fig
+
+def comparison_player_ids(db):
+    # ?player_id=1&player_id=2... or a whole group via ?session_id=3&group_number=1
+    player_ids = request.args.getlist('player_id', type=int)
+    session_id = request.args.get('session_id', type=int)
+    group_number = request.args.get('group_number', type=int)
+    if session_id is not None and group_number is not None:
+        player_ids += [p['player_id'] for p in db.get_players_by_group(session_id, group_number)]
+    return player_ids[:50]
+
+@app.route('/leagues/<league>/ratings/compare.png', methods=['GET'])
+def graph_rating_comparison(league):
+    db = get_db(league)
+    history_rows = db.get_ratings_history_for_players(comparison_player_ids(db))
+    sessions, series = rating_series(history_rows)
+    fig = plot_rating_comparison(sessions, series)
+    output = io.BytesIO()
+    FigureCanvas = lazy_import('matplotlib.backends.backend_agg').FigureCanvasAgg
     FigureCanvas(fig).print_png(output)
     return Response(output.getvalue(), mimetype='image/png')
 
+@app.route('/leagues/<league>/ratings/series.json', methods=['GET'])
+def rating_series_json(league):
+    # same data as compare.png for clients that draw their own charts
+    db = get_db(league)
+    history_rows = db.get_ratings_history_for_players(comparison_player_ids(db))
+    sessions, series = rating_series(history_rows)
+    return jsonify({'sessions': sessions, 'series': series})
+
 #### MATCH SUMMARIES BY PLAYER
 
 @app.route('/leagues/<league>/player/<player_id>/match-stats', methods=['GET', 'POST'])
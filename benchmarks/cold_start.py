@@ -0,0 +1,60 @@
+'''
+time a cold `import app` in a fresh interpreter and fail if it goes over budget
+
+usage (from the repo root):
+    python -m benchmarks.cold_start [budget_seconds]
+
+exits 1 if the median import time is over budget or if any of the heavy
+modules got imported at load time
+'''
+import os
+import statistics
+import subprocess
+import sys
+
+app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_BUDGET = 0.75
+RUNS = 5
+
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+loaded = [m for m in app.HEAVY_MODULES if m in sys.modules]
+print(elapsed)
+print(','.join(loaded))
+"""
+
+
+def time_import():
+    out = subprocess.run(
+        [sys.executable, '-c', IMPORT_SCRIPT],
+        cwd=app_dir,
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True
+    ).stdout.splitlines()
+    loaded = [m for m in out[1].split(',') if m] if len(out) > 1 else []
+    return float(out[0]), loaded
+
+
+if __name__ == '__main__':
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET
+    timings = []
+    loaded = []
+    for _ in range(RUNS):
+        elapsed, loaded = time_import()
+        timings.append(elapsed)
+    median = statistics.median(timings)
+    print('import app: median {:.3f}s (min {:.3f}s, max {:.3f}s), budget {:.3f}s'.format(
+        median, min(timings), max(timings), budget))
+    failed = False
+    if loaded:
+        print('heavy modules imported at load time: {}'.format(', '.join(loaded)))
+        failed = True
+    if median > budget:
+        print('cold start over budget')
+        failed = True
+    sys.exit(1 if failed else 0)
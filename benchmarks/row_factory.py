@@ -0,0 +1,94 @@
+'''
+compare dict_factory with the RecordFactory rows on a big match history
+
+usage (from the repo root):
+    python -m benchmarks.row_factory [num_sessions]
+'''
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from data_access.data_access import DataAccess, dict_factory
+from data_access.rows import RecordFactory
+
+app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_PATH = os.path.join(app_dir, 'data_access/schema.sql')
+
+MATCH_SQL = """
+select
+    p1.player_id player_1_id,
+    p1.name player_1_name,
+    p1.rating player_1_rating,
+    m.player_1_wins,
+    p2.player_id player_2_id,
+    p2.name player_2_name,
+    p2.rating player_2_rating,
+    m.player_2_wins
+from match m
+join player p1
+    on p1.player_id = m.player_1_id
+join player p2
+    on p2.player_id = m.player_2_id
+"""
+
+
+def build_league(num_players=60, num_sessions=500, group_size=6):
+    db = DataAccess(':memory:')
+    db.connect()
+    db.init_db(SCHEMA_PATH)
+    player_ids = [
+        db.add_player('Player {}'.format(n), random.randint(800, 2200))
+        for n in range(num_players)
+    ]
+    sql = """
+    insert into match (
+        player_1_id, player_1_wins, player_2_id, player_2_wins,
+        group_number, session_id, ordinal
+    )
+    values (?, ?, ?, ?, ?, ?, ?)
+    """
+    rows = []
+    for s in range(num_sessions):
+        session_id = db.add_session('s{}'.format(s))
+        players = random.sample(player_ids, group_size)
+        for i, p1 in enumerate(players):
+            for p2 in players[i + 1:]:
+                w1 = random.randint(0, 3)
+                w2 = 3 if w1 < 3 else random.randint(0, 2)
+                rows.append((p1, w1, p2, w2, 1, session_id, 1))
+                rows.append((p2, w2, p1, w1, 1, session_id, 2))
+    db.cursor.executemany(sql, rows)
+    db.conn.commit()
+    return db
+
+
+def run(conn, factory, repeat=5):
+    conn.row_factory = factory
+    cursor = conn.cursor()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(MATCH_SQL)
+        rows = cursor.fetchall()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    del rows
+    tracemalloc.start()
+    cursor.execute(MATCH_SQL)
+    rows = cursor.fetchall()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, current, len(rows)
+
+
+if __name__ == '__main__':
+    num_sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    random.seed(0)
+    db = build_league(num_sessions=num_sessions)
+    for name, factory in [('dict_factory', dict_factory), ('RecordFactory', RecordFactory())]:
+        best, mem, n = run(db.conn, factory)
+        print('{:<14} {:>8} rows  {:8.1f} ms  {:8.1f} KiB retained'.format(
+            name, n, best * 1000, mem / 1024))
+    db.close()
@@ -1,5 +1,10 @@
 
 import sqlite3 
+from data_access.rows import RecordFactory
+from data_access import queries
+
+# league files whose views / indexes are known to be current (per process)
+_upgraded_paths = set()
 
 def dict_factory(cursor, row):
     d = {}
@@ -17,8 +22,9 @@ class DataAccess():
 
     def connect(self):
         self.conn = sqlite3.connect(self.db_path)
-        self.conn.row_factory = dict_factory
+        self.conn.row_factory = RecordFactory()
         self.cursor = self.conn.cursor()
+        self.upgrade_schema()
 
     def close(self):
         self.cursor.close()
@@ -28,6 +34,24 @@ class DataAccess():
         with open(schema_sql_file) as f:
             self.cursor.executescript(f.read())
         self.conn.commit()
+        self.upgrade_schema(force=True)
+
+    def upgrade_schema(self, force=False):
+        if self.db_path in _upgraded_paths and not force:
+            return
+        # brand new league files are empty until init_db runs
+        self.cursor.execute("select 1 from sqlite_master where type = 'table' and name = 'match'")
+        if self.cursor.fetchone() is None:
+            return
+        for sql in queries.SCHEMA_UPGRADES:
+            self.cursor.execute(sql)
+        for table, column, definition, backfill in queries.COLUMN_UPGRADES:
+            self.cursor.execute('pragma table_info({})'.format(table))
+            if column not in [c['name'] for c in self.cursor.fetchall()]:
+                self.cursor.execute('alter table {} add column {} {}'.format(table, column, definition))
+                self.cursor.execute(backfill)
+        self.conn.commit()
+        _upgraded_paths.add(self.db_path)
 
     def add_player(self, player_name, rating, dominant_hand=None, racket_type=None):
         sql = """
@@ -76,53 +100,34 @@ class DataAccess():
         self.conn.commit()
 
     def get_matches_by_group(self, session_id, group_number):
-        sql = """
-        select
-            p1.player_id player_1_id,
-            p1.name player_1_name,
-            p1.rating player_1_rating,
-            m.player_1_wins,
-            p2.player_id player_2_id,
-            p2.name player_2_name,
-            p2.rating player_2_rating,
-            m.player_2_wins
-        from match m
-        join player p1
-            on p1.player_id = m.player_1_id
-        join player p2
-            on p2.player_id = m.player_2_id
-        where m.session_id = ?
-        and m.group_number = ?
-        and m.ordinal = 1
-        """
-        self.cursor.execute(sql, (session_id, group_number))
+        self.cursor.execute(queries.MATCHES_BY_GROUP, (session_id, group_number))
         return self.cursor.fetchall()
 
     def get_matches_by_player(self, player_id, start_session_id=None):
-        sql = """
-        select
-            p1.player_id player_1_id,
-            p1.name player_1_name,
-            p1.rating player_1_rating,
-            m.player_1_wins,
-            p2.player_id player_2_id,
-            p2.name player_2_name,
-            p2.rating player_2_rating,
-            m.player_2_wins
-        from match m
-        join player p1
-            on p1.player_id = m.player_1_id
-        join player p2
-            on p2.player_id = m.player_2_id
-        where p1.player_id = ?
-        """
-        params = (player_id,)
-        if start_session_id is not None:
-            sql += """
-            and m.session_id >= ?
-            """
-            params = (player_id, start_session_id)
+        if start_session_id is None:
+            self.cursor.execute(queries.MATCHES_BY_PLAYER, (player_id,))
+        else:
+            self.cursor.execute(queries.MATCHES_BY_PLAYER_SINCE, (player_id, start_session_id))
+        return self.cursor.fetchall()
 
+    def get_match_detail(self, session_id, p1_id, p2_id):
+        self.cursor.execute(queries.MATCH_IN_SESSION, (session_id, p1_id, p2_id))
+        return self.cursor.fetchone()
+
+    def get_matches_by_player_page(self, player_id, before=None, limit=50):
+        '''
+        newest first. before is the (session_id, player_2_id) of the last
+        row on the previous page
+        '''
+        if before is None:
+            self.cursor.execute(queries.PLAYER_MATCHES_PAGE, (player_id, limit))
+        else:
+            params = (player_id, before[0], before[1], limit)
+            self.cursor.execute(queries.PLAYER_MATCHES_PAGE_BEFORE, params)
+        return self.cursor.fetchall()
+
+    def get_matches(self, match_query):
+        sql, params = match_query.build()
         self.cursor.execute(sql, params)
         return self.cursor.fetchall()
 
@@ -137,25 +142,7 @@ class DataAccess():
         return self.cursor.fetchone()['c']
 
     def get_match_results(self, session_id):
-        sql = """
-        select
-            p1.player_id player_1_id,
-            p1.name player_1_name,
-            p1.rating player_1_rating,
-            m.player_1_wins,
-            p2.player_id player_2_id,
-            p2.name player_2_name,
-            p2.rating player_2_rating,
-            m.player_2_wins
-        from match m
-        join player p1
-            on p1.player_id = m.player_1_id
-        join player p2
-            on p2.player_id = m.player_2_id
-        where m.session_id = ?
-        and m.ordinal = 1
-        """
-        self.cursor.execute(sql, (session_id,))
+        self.cursor.execute(queries.MATCHES_BY_SESSION, (session_id,))
         return self.cursor.fetchall()
 
     def get_match(self, session_id, p1_id, p2_id):
@@ -182,15 +169,19 @@ class DataAccess():
         return self.cursor.lastrowid
 
     def add_rating(self, player_id, session_id, previous_rating, rating, won_group=0):
-        check_sql = """
-        select 1 
-        from rating
+        # a session saved again after a score correction overwrites its
+        # ratings, previous_rating stays what the player came in with
+        update_sql = """
+        update rating
+            set rating = ?,
+                won_group = ?
         where player_id = ?
         and session_id = ?
         """
-        self.cursor.execute(check_sql, (player_id, session_id))
-        if self.cursor.fetchone():
-            return 
+        self.cursor.execute(update_sql, (rating, won_group, player_id, session_id))
+        if self.cursor.rowcount:
+            self.conn.commit()
+            return
 
         sql = """
         insert into rating (
@@ -205,6 +196,31 @@ class DataAccess():
         self.cursor.execute(sql, (player_id, session_id, previous_rating, rating, won_group))
         self.conn.commit()
 
+    def get_session_ratings(self, session_id):
+        sql = """
+        select
+            player_id,
+            previous_rating,
+            rating,
+            won_group
+        from rating
+        where session_id = ?
+        """
+        self.cursor.execute(sql, (session_id,))
+        return self.cursor.fetchall()
+
+    def has_later_rating(self, player_id, session_id):
+        # rated in a session after this one, so player.rating already moved on
+        sql = """
+        select 1
+        from rating
+        where player_id = ?
+        and session_id > ?
+        limit 1
+        """
+        self.cursor.execute(sql, (player_id, session_id))
+        return self.cursor.fetchone() is not None
+
     def get_player(self, player_id):
         sql = """
         select 
@@ -238,6 +254,24 @@ class DataAccess():
         self.cursor.execute(sql, (session_id, player_id))
         return self.cursor.fetchone()
 
+    def get_session_start_ratings(self, session_id):
+        # rating each player came into the session with (their current
+        # rating until the session's ratings have been saved)
+        sql = """
+        select
+            p.player_id,
+            coalesce(r.previous_rating, p.rating) rating
+        from session_to_player stp
+        join player p
+            on stp.player_id = p.player_id
+        left join rating r
+            on r.player_id = stp.player_id
+            and r.session_id = stp.session_id
+        where stp.session_id = ?
+        """
+        self.cursor.execute(sql, (session_id,))
+        return self.cursor.fetchall()
+
     def get_players(self):
         sql = """
         select 
@@ -250,6 +284,88 @@ class DataAccess():
         self.cursor.execute(sql)
         return self.cursor.fetchall()
 
+    def get_players_page(self, after=None, limit=50):
+        '''
+        players in name order. after is the (name, player_id) of the last
+        row on the previous page
+        '''
+        if after is None:
+            sql = """
+            select
+                player_id,
+                name,
+                rating
+            from player
+            order by name, player_id
+            limit ?
+            """
+            params = (limit,)
+        else:
+            sql = """
+            select
+                player_id,
+                name,
+                rating
+            from player
+            where (name, player_id) > (?, ?)
+            order by name, player_id
+            limit ?
+            """
+            params = (after[0], after[1], limit)
+        self.cursor.execute(sql, params)
+        return self.cursor.fetchall()
+
+    def get_players_by_ids(self, player_ids):
+        if not player_ids:
+            return []
+        sql = """
+        select
+            player_id,
+            name,
+            rating
+        from player
+        where player_id in ({})
+        """.format(', '.join('?' * len(player_ids)))
+        self.cursor.execute(sql, tuple(player_ids))
+        return self.cursor.fetchall()
+
+    def get_player_ratings(self):
+        sql = """
+        select
+            player_id,
+            rating
+        from player
+        """
+        self.cursor.execute(sql)
+        return self.cursor.fetchall()
+
+    def get_recent_opponents(self, player_id, num_sessions):
+        # everyone the player has been drawn against in the league's last few sessions
+        sql = """
+        select distinct
+            player_2_id
+        from match
+        where player_1_id = ?
+        and session_id in (
+            select session_id
+            from session
+            order by session_id desc
+            limit ?
+        )
+        """
+        self.cursor.execute(sql, (player_id, num_sessions))
+        return [r['player_2_id'] for r in self.cursor.fetchall()]
+
+    def get_player_names(self):
+        sql = """
+        select
+            player_id,
+            name
+        from player
+        """
+        self.cursor.execute(sql)
+        return self.cursor.fetchall()
+
     def get_sessions(self):
         sql = """
         select 
@@ -261,6 +377,81 @@ class DataAccess():
         self.cursor.execute(sql)
         return self.cursor.fetchall()
 
+    def get_sessions_page(self, before_session_id=None, limit=20):
+        # newest first
+        if before_session_id is None:
+            sql = """
+            select
+                session_id,
+                session_date
+            from session
+            order by session_id desc
+            limit ?
+            """
+            params = (limit,)
+        else:
+            sql = """
+            select
+                session_id,
+                session_date
+            from session
+            where session_id < ?
+            order by session_id desc
+            limit ?
+            """
+            params = (before_session_id, limit)
+        self.cursor.execute(sql, params)
+        return self.cursor.fetchall()
+
+    def get_session_cache(self, session_id, cache_key):
+        # only finalized sessions have entries (reopen_session clears them)
+        sql = """
+        select
+            content
+        from session_cache
+        where session_id = ?
+        and cache_key = ?
+        """
+        self.cursor.execute(sql, (session_id, cache_key))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        return row['content']
+
+    def finalize_session(self, session_id, cache_entries):
+        '''
+        args:
+            cache_entries dict of cache_key -> rendered content
+        '''
+        self.cursor.execute("update session set finalized = 1 where session_id = ?", (session_id,))
+        sql = """
+        insert or replace into session_cache (
+            session_id,
+            cache_key,
+            content
+        )
+        values (?, ?, ?)
+        """
+        self.cursor.executemany(
+            sql, [(session_id, key, content) for key, content in cache_entries.items()])
+        self.conn.commit()
+
+    def is_session_finalized(self, session_id):
+        sql = """
+        select
+            finalized
+        from session
+        where session_id = ?
+        """
+        self.cursor.execute(sql, (session_id,))
+        row = self.cursor.fetchone()
+        return bool(row and row['finalized'])
+
+    def reopen_session(self, session_id):
+        self.cursor.execute("update session set finalized = 0 where session_id = ?", (session_id,))
+        self.cursor.execute("delete from session_cache where session_id = ?", (session_id,))
+        self.conn.commit()
+
     def add_session_to_player(self, session_id, player_id):
         check_sql = """
         select 1
@@ -323,6 +514,27 @@ class DataAccess():
         self.cursor.execute(sql, (player_id,))
         return self.cursor.fetchall()
 
+    def get_ratings_history_for_players(self, player_ids):
+        if not player_ids:
+            return []
+        sql = """
+        select
+            r.player_id,
+            p.name,
+            s.session_id,
+            s.session_date,
+            r.rating
+        from rating r
+        join session s
+            on r.session_id = s.session_id
+        join player p
+            on r.player_id = p.player_id
+        where r.player_id in ({})
+        order by s.session_id, r.player_id
+        """.format(', '.join('?' * len(player_ids)))
+        self.cursor.execute(sql, tuple(player_ids))
+        return self.cursor.fetchall()
+
     def get_session_date(self, session_id):
         sql = """
         select 
@@ -349,6 +561,45 @@ class DataAccess():
         self.cursor.execute(sql, (session_id, group_number))
         return self.cursor.fetchall()
 
+    def get_match_history(self):
+        # every played match once, oldest session first
+        sql = """
+        select
+            session_id,
+            player_1_id,
+            player_1_wins,
+            player_2_id,
+            player_2_wins
+        from match
+        where ordinal = 1
+        and player_1_wins is not null
+        and player_2_wins is not null
+        order by session_id
+        """
+        self.cursor.execute(sql)
+        return self.cursor.fetchall()
+
+    def get_initial_ratings(self):
+        # rating going into a player's first session (current rating if they have none)
+        sql = """
+        select
+            p.player_id,
+            coalesce(
+                (
+                    select r.previous_rating
+                    from rating r
+                    where r.player_id = p.player_id
+                    order by r.session_id
+                    limit 1
+                ),
+                p.rating
+            ) rating
+        from player p
+        order by p.player_id
+        """
+        self.cursor.execute(sql)
+        return self.cursor.fetchall()
+
 
 if __name__ == '__main__':
     da = DataAccess('test_db_file.db')
@@ -0,0 +1,378 @@
+'''
+all leagues in one database (schema_multi.sql) instead of a file per league.
+
+LeagueDataAccess has the same api as DataAccess, scoped to one league: on
+connect it creates temp views named after each table (player, match, ...)
+that only show the current league's rows, and use_league switches league
+without reconnecting. temp objects shadow the real tables,
+so every read query in DataAccess works unchanged. writes can't go
+through the views, so those methods are overridden to write to the main
+tables with the league_id filled in.
+
+merge the existing league files into one database (from the repo root):
+    python -m data_access.multi_league <league dir> <combined.db>
+check that leagues stay apart across connections:
+    python -m data_access.multi_league --check
+'''
+import os
+import sqlite3
+import sys
+import tempfile
+from urllib.request import pathname2url
+
+from data_access.data_access import DataAccess
+from data_access import queries
+
+LEAGUE_TABLES = ['player', 'session', 'match', 'rating', 'session_to_player', 'session_cache']
+
+MULTI_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema_multi.sql')
+
+
+def next_id_sql(table, id_column):
+    # ids are numbered per league
+    return '(select coalesce(max({0}), 0) + 1 from main.{1} where league_id = ?)'.format(
+        id_column, table)
+
+
+class LeagueDataAccess(DataAccess):
+    def __init__(self, db_path, league):
+        '''
+        args:
+            db_path the shared database
+            league league name, the same key the file layout used ('sams_garage.db')
+        '''
+        super().__init__(db_path)
+        self.league = league
+        self.league_id = None
+        self._views_ready = False
+
+    def get_league_id(self):
+        self.cursor.execute("select 1 from sqlite_master where type = 'table' and name = 'league'")
+        if self.cursor.fetchone() is None:
+            return None
+        self.cursor.execute("select league_id from main.league where name = ?", (self.league,))
+        row = self.cursor.fetchone()
+        return row['league_id'] if row else None
+
+    def upgrade_schema(self, force=False):
+        # no migrations here, just point the temp views at this league
+        self.use_league(self.league)
+
+    def scope_views(self):
+        '''
+        temp views named after each table showing only the current league's
+        rows. they're made once per connection and read the league from
+        temp.current_league, so switching leagues is a single update
+        '''
+        if self._views_ready:
+            return
+        self.cursor.execute("select 1 from sqlite_master where type = 'table' and name = 'player'")
+        if self.cursor.fetchone() is None:
+            # tables come with init_db
+            return
+        self.cursor.execute('create temp table if not exists current_league (league_id integer)')
+        for table in LEAGUE_TABLES:
+            self.cursor.execute(
+                'create temp view if not exists {0} as select * from main.{0} '
+                'where league_id = (select league_id from temp.current_league)'.format(table))
+        # the catalog views have to live in temp too, a view in main only
+        # ever sees main's (unscoped) tables
+        self.cursor.execute(queries.MATCH_DETAIL_VIEW.replace(
+            'create view if not exists', 'create temp view if not exists'))
+        self.conn.commit()
+        self._views_ready = True
+
+    def use_league(self, league):
+        '''
+        switch an open connection to another league. an unknown league (not
+        created yet) sees empty tables
+        '''
+        self.league = league
+        self.league_id = self.get_league_id()
+        # a connection opened before the tables existed has no views yet,
+        # without them reads would see every league's rows
+        self.scope_views()
+        if not self._views_ready:
+            return
+        self.cursor.execute('delete from temp.current_league')
+        self.cursor.execute('insert into temp.current_league values (?)', (self.league_id,))
+        self.conn.commit()
+
+    def init_db(self, schema_sql_file=MULTI_SCHEMA_PATH):
+        '''
+        creates the shared tables if needed and registers this league
+        '''
+        with open(schema_sql_file) as f:
+            self.cursor.executescript(f.read())
+        self.cursor.execute("insert or ignore into main.league (name) values (?)", (self.league,))
+        self.conn.commit()
+        self.upgrade_schema()
+
+    def get_leagues(self):
+        self.cursor.execute("select 1 from sqlite_master where type = 'table' and name = 'league'")
+        if self.cursor.fetchone() is None:
+            return []
+        self.cursor.execute("select name from main.league order by name")
+        return [r['name'] for r in self.cursor.fetchall()]
+
+    #### WRITES
+
+    def add_player(self, player_name, rating, dominant_hand=None, racket_type=None):
+        sql = """
+        insert into main.player (
+            league_id,
+            player_id,
+            name,
+            dominant_hand,
+            racket_type,
+            rating
+        )
+        values (?, {}, ?, ?, ?, ?)
+        """.format(next_id_sql('player', 'player_id'))
+        params = (self.league_id, self.league_id, player_name, dominant_hand, racket_type, rating)
+        self.cursor.execute(sql, params)
+        self.cursor.execute("select player_id from main.player where rowid = ?", (self.cursor.lastrowid,))
+        player_id = self.cursor.fetchone()['player_id']
+        self.conn.commit()
+        return player_id
+
+    def add_match(self, p1_id, p2_id, group_number, session_id, p1_wins=None, p2_wins=None):
+        sql = """
+        insert into main.match (
+            league_id,
+            player_1_id,
+            player_1_wins,
+            player_2_id,
+            player_2_wins,
+            group_number,
+            session_id,
+            ordinal
+        )
+        values (?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        self.cursor.execute(sql, (self.league_id, p1_id, p1_wins, p2_id, p2_wins, group_number, session_id, 1))
+        self.cursor.execute(sql, (self.league_id, p2_id, p2_wins, p1_id, p1_wins, group_number, session_id, 2))
+        self.conn.commit()
+
+    def update_match(self, p1_id, p2_id, session_id, p1_wins=None, p2_wins=None):
+        sql = """
+        update main.match
+            set player_1_wins = ?,
+                player_2_wins = ?
+        where league_id = ?
+        and player_1_id = ?
+        and player_2_id = ?
+        and session_id = ?
+        """
+        self.cursor.execute(sql, (p1_wins, p2_wins, self.league_id, p1_id, p2_id, session_id))
+        self.cursor.execute(sql, (p2_wins, p1_wins, self.league_id, p2_id, p1_id, session_id))
+        self.conn.commit()
+
+    def add_session(self, session_date):
+        sql = """
+        insert into main.session (
+            league_id,
+            session_id,
+            session_date
+        )
+        values (?, {}, ?)
+        """.format(next_id_sql('session', 'session_id'))
+        self.cursor.execute(sql, (self.league_id, self.league_id, session_date))
+        self.cursor.execute("select session_id from main.session where rowid = ?", (self.cursor.lastrowid,))
+        session_id = self.cursor.fetchone()['session_id']
+        self.conn.commit()
+        return session_id
+
+    def add_rating(self, player_id, session_id, previous_rating, rating, won_group=0):
+        update_sql = """
+        update main.rating
+            set rating = ?,
+                won_group = ?
+        where league_id = ?
+        and player_id = ?
+        and session_id = ?
+        """
+        self.cursor.execute(update_sql, (rating, won_group, self.league_id, player_id, session_id))
+        if self.cursor.rowcount:
+            self.conn.commit()
+            return
+
+        sql = """
+        insert into main.rating (
+            league_id,
+            player_id,
+            session_id,
+            previous_rating,
+            rating,
+            won_group
+        )
+        values (?, ?, ?, ?, ?, ?)
+        """
+        params = (self.league_id, player_id, session_id, previous_rating, rating, won_group)
+        self.cursor.execute(sql, params)
+        self.conn.commit()
+
+    def update_player_rating(self, player_id, rating):
+        sql = """
+        update main.player
+            set rating = ?
+        where league_id = ?
+        and player_id = ?
+        """
+        self.cursor.execute(sql, (rating, self.league_id, player_id))
+        self.conn.commit()
+
+    def finalize_session(self, session_id, cache_entries):
+        self.cursor.execute(
+            "update main.session set finalized = 1 where league_id = ? and session_id = ?",
+            (self.league_id, session_id))
+        sql = """
+        insert or replace into main.session_cache (
+            league_id,
+            session_id,
+            cache_key,
+            content
+        )
+        values (?, ?, ?, ?)
+        """
+        self.cursor.executemany(
+            sql, [(self.league_id, session_id, key, content) for key, content in cache_entries.items()])
+        self.conn.commit()
+
+    def reopen_session(self, session_id):
+        self.cursor.execute(
+            "update main.session set finalized = 0 where league_id = ? and session_id = ?",
+            (self.league_id, session_id))
+        self.cursor.execute(
+            "delete from main.session_cache where league_id = ? and session_id = ?",
+            (self.league_id, session_id))
+        self.conn.commit()
+
+    def add_session_to_player(self, session_id, player_id):
+        check_sql = """
+        select 1
+        from session_to_player
+        where session_id = ?
+        and player_id = ?
+        """
+        self.cursor.execute(check_sql, (session_id, player_id))
+        if self.cursor.fetchone() is not None:
+            return
+
+        sql = """
+        insert into main.session_to_player (
+            league_id,
+            session_id,
+            player_id
+        )
+        values (?, ?, ?)
+        """
+        self.cursor.execute(sql, (self.league_id, session_id, player_id))
+        self.conn.commit()
+
+    def update_player_group(self, session_id, player_id, group_number):
+        sql = """
+        update main.session_to_player
+        set group_number = ?
+        where league_id = ?
+        and session_id = ?
+        and player_id = ?
+        """
+        self.cursor.execute(sql, (group_number, self.league_id, session_id, player_id))
+        self.conn.commit()
+
+
+def merge_league_file(combined, league_path):
+    '''
+    copy one league file into the combined database, keeping its ids. the
+    league file is only read (opened read-only, no schema upgrade), columns
+    it doesn't have yet (e.g. session.finalized) get their defaults
+
+    args:
+        combined LeagueDataAccess for the combined db (any league)
+    '''
+    source = sqlite3.connect('file:{}?mode=ro'.format(pathname2url(os.path.abspath(league_path))), uri=True)
+    try:
+        combined.use_league(os.path.basename(league_path))
+        combined.init_db()
+        league_id = combined.league_id
+        cursor = combined.cursor
+        backfill_finalized = False
+        for table in LEAGUE_TABLES:
+            cursor.execute('select count(*) c from main.{} where league_id = ?'.format(table), (league_id,))
+            if cursor.fetchone()['c']:
+                raise ValueError('league {} already has {} rows'.format(combined.league, table))
+            source_columns = [c[1] for c in source.execute('pragma table_info({})'.format(table))]
+            cursor.execute('pragma main.table_info({})'.format(table))
+            combined_columns = set(c['name'] for c in cursor.fetchall())
+            columns = [c for c in source_columns if c in combined_columns and c != 'league_id']
+            if not columns:
+                # table the league file doesn't have (never initialized, or older schema)
+                continue
+            rows = source.execute('select {} from {}'.format(', '.join(columns), table))
+            cursor.executemany(
+                'insert into main.{0} (league_id, {1}) values (?, {2})'.format(
+                    table, ', '.join(columns), ', '.join('?' * len(columns))),
+                ((league_id,) + tuple(row) for row in rows))
+            if table == 'session' and 'finalized' not in source_columns:
+                backfill_finalized = True
+        if backfill_finalized:
+            # same backfill DataAccess.upgrade_schema does for older files
+            cursor.execute(
+                'update main.session set finalized = 1 where league_id = ? '
+                'and session_id in (select session_id from main.rating where league_id = ?)',
+                (league_id, league_id))
+        combined.conn.commit()
+    finally:
+        source.close()
+
+
+def check_league_isolation(db_path):
+    '''
+    a connection opened before any league existed must still only see
+    its own league once another connection has created them
+
+    returns:
+        player names connection A sees in each league
+    '''
+    a = LeagueDataAccess(db_path, None)
+    a.connect()
+    b = LeagueDataAccess(db_path, 'one.db')
+    b.connect()
+    b.init_db()
+    b.add_player('Alice', 1500)
+    b.use_league('two.db')
+    b.init_db()
+    b.add_player('Bob', 1500)
+    b.close()
+    seen = {}
+    for league in ('one.db', 'two.db'):
+        a.use_league(league)
+        seen[league] = [p['name'] for p in a.get_players()]
+    a.close()
+    return seen
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--check']:
+        # python -m data_access.multi_league --check
+        with tempfile.TemporaryDirectory() as tmp:
+            seen = check_league_isolation(os.path.join(tmp, 'leagues.db'))
+        print(seen)
+        assert seen == {'one.db': ['Alice'], 'two.db': ['Bob']}
+        sys.exit(0)
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    league_dir, combined_path = sys.argv[1], sys.argv[2]
+    league_files = sorted(
+        f for f in os.listdir(league_dir)
+        if f.endswith('.db') and not f.startswith('.')
+        and os.path.abspath(os.path.join(league_dir, f)) != os.path.abspath(combined_path)
+    )
+    combined = LeagueDataAccess(combined_path, None)
+    combined.connect()
+    for f in league_files:
+        merge_league_file(combined, os.path.join(league_dir, f))
+        print('merged {}'.format(f))
+    combined.close()
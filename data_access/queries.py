@@ -0,0 +1,159 @@
+
+# Query catalog: shared views and the named statements built on them.
+# sqlite keeps a per-connection cache of compiled statements keyed by the
+# sql text. app.get_db keeps each thread's connection open between requests,
+# so these (fixed) statements are compiled once per thread, not per request.
+
+# one row per match side with both players joined in
+MATCH_DETAIL_VIEW = """
+create view if not exists match_detail as
+select
+    m.session_id,
+    m.group_number,
+    m.ordinal,
+    p1.player_id player_1_id,
+    p1.name player_1_name,
+    p1.rating player_1_rating,
+    m.player_1_wins,
+    p2.player_id player_2_id,
+    p2.name player_2_name,
+    p2.rating player_2_rating,
+    m.player_2_wins
+from match m
+join player p1
+    on p1.player_id = m.player_1_id
+join player p2
+    on p2.player_id = m.player_2_id
+"""
+
+INDEXES = [
+    "create index if not exists match_session_group on match (session_id, group_number, ordinal)",
+    "create index if not exists match_player_session on match (player_1_id, session_id)",
+    "create index if not exists player_name on player (name, player_id)",
+]
+
+SESSION_CACHE_TABLE = """
+create table if not exists session_cache (
+    session_id integer,
+    cache_key varchar(50),
+    content text,
+    FOREIGN KEY(session_id) REFERENCES session(session_id),
+    CONSTRAINT entry_per_session UNIQUE(session_id,cache_key)
+)
+"""
+
+# run on every connect so league files made before the catalog existed
+# pick up the views and indexes too (all statements are idempotent)
+SCHEMA_UPGRADES = [MATCH_DETAIL_VIEW, SESSION_CACHE_TABLE] + INDEXES
+
+# (table, column, definition, backfill sql) added to older league files
+COLUMN_UPGRADES = [
+    (
+        'session', 'finalized', 'integer DEFAULT 0',
+        # sessions saved before finalizing existed already have ratings
+        'update session set finalized = 1 where session_id in (select session_id from rating)'
+    ),
+]
+
+MATCH_COLUMNS = """
+select
+    player_1_id,
+    player_1_name,
+    player_1_rating,
+    player_1_wins,
+    player_2_id,
+    player_2_name,
+    player_2_rating,
+    player_2_wins,
+    group_number,
+    session_id
+from match_detail
+"""
+
+
+class MatchQuery():
+    '''
+    composable filters over match_detail
+
+        sql, params = MatchQuery().session(3).group(1).build()
+
+    every filter adds a fixed predicate so the same combination of filters
+    always produces the same sql text
+    '''
+    def __init__(self, columns=MATCH_COLUMNS):
+        self.columns = columns
+        self.predicates = []
+        self.params = []
+        self.order = None
+        self.limit_rows = None
+        self.one_side = True
+
+    def _where(self, predicate, *params):
+        self.predicates.append(predicate)
+        self.params.extend(params)
+        return self
+
+    def session(self, session_id):
+        return self._where('session_id = ?', session_id)
+
+    def group(self, group_number):
+        return self._where('group_number = ?', group_number)
+
+    def player(self, player_id):
+        # the match table is symmetric, so filtering player_1 picks out
+        # each of this player's matches exactly once (from their side)
+        self.one_side = False
+        return self._where('player_1_id = ?', player_id)
+
+    def players(self, player_id1, player_id2):
+        self.one_side = False
+        return self._where('player_1_id = ? and player_2_id = ?', player_id1, player_id2)
+
+    def session_range(self, start_session_id=None, end_session_id=None):
+        if start_session_id is not None:
+            self._where('session_id >= ?', start_session_id)
+        if end_session_id is not None:
+            self._where('session_id <= ?', end_session_id)
+        return self
+
+    def before(self, session_id, player_2_id):
+        # keyset paging, newest first: use with order_by(NEWEST_FIRST)
+        return self._where('(session_id, player_2_id) < (?, ?)', session_id, player_2_id)
+
+    def order_by(self, order):
+        self.order = order
+        return self
+
+    def limit(self, limit):
+        self.limit_rows = limit
+        return self
+
+    def build(self):
+        predicates = list(self.predicates)
+        if self.one_side:
+            predicates.append('ordinal = 1')
+        sql = self.columns
+        if predicates:
+            sql += 'where ' + '\nand '.join(predicates) + '\n'
+        if self.order:
+            sql += 'order by ' + self.order + '\n'
+        params = tuple(self.params)
+        if self.limit_rows is not None:
+            sql += 'limit ?\n'
+            params += (self.limit_rows,)
+        return sql, params
+
+
+NEWEST_FIRST = 'session_id desc, player_2_id desc'
+
+
+# named statements used by DataAccess
+MATCHES_BY_GROUP = MatchQuery().session(None).group(None).build()[0]
+MATCHES_BY_SESSION = MatchQuery().session(None).build()[0]
+MATCHES_BY_PLAYER = MatchQuery().player(None).build()[0]
+MATCHES_BY_PLAYER_SINCE = MatchQuery().player(None).session_range(0).build()[0]
+MATCH_IN_SESSION = MatchQuery().session(None).players(None, None).build()[0]
+PLAYER_MATCHES_PAGE = MatchQuery().player(None).order_by(NEWEST_FIRST).limit(0).build()[0]
+PLAYER_MATCHES_PAGE_BEFORE = (
+    MatchQuery().player(None).before(None, None).order_by(NEWEST_FIRST).limit(0).build()[0]
+)
@@ -0,0 +1,85 @@
+
+from collections import namedtuple
+
+# cache of record classes keyed by the column names of a statement
+_record_classes = {}
+
+
+class Record(tuple):
+    '''
+    base for the row records handed out by the database. records are
+    plain tuples underneath (so cheap to build) but still support
+    row['column'] lookups so the templates and the rest of the app
+    can keep treating them like the old dicts
+    '''
+    __slots__ = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise KeyError(key)
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def get(self, key, default=None):
+        idx = self._index.get(key)
+        if idx is None:
+            return default
+        return tuple.__getitem__(self, idx)
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def to_dict(self):
+        return dict(zip(self._fields, self))
+
+
+def record_class(columns):
+    '''
+    args:
+        columns tuple of column names (as in cursor.description)
+    returns:
+        Record subclass with attribute + key access to those columns
+    '''
+    cls = _record_classes.get(columns)
+    if cls is None:
+        # rename=True so odd column names (count(*) etc.) don't blow up
+        base = namedtuple('Row', columns, rename=True)
+        cls = type('Row', (Record, base), {
+            '__slots__': (),
+            '_index': {c: i for i, c in enumerate(columns)},
+        })
+        # keep the real column names around for keys() / to_dict()
+        cls._fields = columns
+        _record_classes[columns] = cls
+    return cls
+
+
+class RecordFactory():
+    '''
+    sqlite3 row_factory that builds Records. the column mapping is worked
+    out once per statement (when cursor.description changes) instead of on
+    every row like dict_factory does
+    '''
+    def __init__(self):
+        self._description = None
+        self._new = None
+
+    def __call__(self, cursor, row):
+        description = cursor.description
+        if description is not self._description:
+            columns = tuple(col[0] for col in description)
+            self._new = record_class(columns)._make
+            self._description = description
+        return self._new(row)
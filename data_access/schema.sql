@@ -12,7 +12,8 @@ create table player (
 drop table if exists session;
 create table session (
     session_id integer PRIMARY KEY,
-    session_date varchar(12) -- '03/11/20' (extra room for test matches 03/11/20-1st)
+    session_date varchar(12), -- '03/11/20' (extra room for test matches 03/11/20-1st)
+    finalized integer DEFAULT 0 -- 1 once ratings are saved, 0 again if a score is corrected
 );
 
 -- will have to be symmetric (2 entries for each match)
@@ -52,3 +53,12 @@ create table session_to_player (
     FOREIGN KEY(session_id) REFERENCES session(session_id)
 );
 
+-- rendered results of finalized sessions (html / json), cleared when a session is reopened
+drop table if exists session_cache;
+create table session_cache (
+    session_id integer,
+    cache_key varchar(50),
+    content text,
+    FOREIGN KEY(session_id) REFERENCES session(session_id),
+    CONSTRAINT entry_per_session UNIQUE(session_id,cache_key)
+);
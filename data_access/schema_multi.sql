@@ -0,0 +1,81 @@
+
+-- single database holding every league (see LeagueDataAccess).
+-- same tables as schema.sql plus a league_id on each; ids are numbered
+-- per league so urls stay the same as in the one-file-per-league layout.
+-- only "if not exists" here: this runs again every time a league is added.
+-- names are qualified with main. since temp views shadow the tables
+
+create table if not exists main.league (
+    league_id integer PRIMARY KEY,
+    name varchar(100) NOT NULL UNIQUE -- same key the per-file layout used ('sams_garage.db')
+);
+
+create table if not exists main.player (
+    league_id integer NOT NULL,
+    player_id integer NOT NULL,
+    name varchar(500) NOT NULL,
+    dominant_hand varchar(1), -- l or r
+    racket_type varchar(10), -- penhold, shakehand
+    rating integer,
+    PRIMARY KEY(league_id, player_id),
+    FOREIGN KEY(league_id) REFERENCES league(league_id)
+);
+
+create table if not exists main.session (
+    league_id integer NOT NULL,
+    session_id integer NOT NULL,
+    session_date varchar(12),
+    finalized integer DEFAULT 0,
+    PRIMARY KEY(league_id, session_id),
+    FOREIGN KEY(league_id) REFERENCES league(league_id)
+);
+
+create table if not exists main.match (
+    league_id integer NOT NULL,
+    player_1_id integer,
+    player_1_wins integer,
+    player_2_id integer,
+    player_2_wins integer,
+    group_number integer,
+    session_id integer,
+    ordinal integer,
+    FOREIGN KEY(league_id, player_1_id) REFERENCES player(league_id, player_id),
+    FOREIGN KEY(league_id, player_2_id) REFERENCES player(league_id, player_id),
+    FOREIGN KEY(league_id, session_id) REFERENCES session(league_id, session_id)
+);
+
+create table if not exists main.rating (
+    league_id integer NOT NULL,
+    player_id integer,
+    session_id integer,
+    previous_rating integer,
+    rating integer,
+    won_group integer DEFAULT 0,
+    FOREIGN KEY(league_id, player_id) REFERENCES player(league_id, player_id),
+    FOREIGN KEY(league_id, session_id) REFERENCES session(league_id, session_id),
+    CONSTRAINT player_per_session UNIQUE(league_id,player_id,session_id)
+);
+
+create table if not exists main.session_to_player (
+    league_id integer NOT NULL,
+    session_id integer,
+    player_id integer,
+    group_number integer DEFAULT 0,
+    FOREIGN KEY(league_id, player_id) REFERENCES player(league_id, player_id),
+    FOREIGN KEY(league_id, session_id) REFERENCES session(league_id, session_id)
+);
+
+create table if not exists main.session_cache (
+    league_id integer NOT NULL,
+    session_id integer,
+    cache_key varchar(50),
+    content text,
+    FOREIGN KEY(league_id, session_id) REFERENCES session(league_id, session_id),
+    CONSTRAINT entry_per_session UNIQUE(league_id,session_id,cache_key)
+);
+
+-- every index leads on league_id so one league's queries never touch another's rows
+create index if not exists main.player_league_name on player (league_id, name, player_id);
+create index if not exists main.match_league_session_group on match (league_id, session_id, group_number, ordinal);
+create index if not exists main.match_league_player_session on match (league_id, player_1_id, session_id);
+create index if not exists main.session_to_player_league_session on session_to_player (league_id, session_id, group_number);
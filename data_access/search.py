@@ -0,0 +1,133 @@
+
+import bisect
+import difflib
+import threading
+
+
+class PlayerNameIndex():
+    '''
+    in memory typeahead index over player names. every word of a name is
+    kept in one sorted list, so a prefix lookup is a bisect plus a short
+    scan. anything that doesn't prefix match falls back to difflib for
+    close spellings
+    '''
+    def __init__(self):
+        # sorted (word, player_id)
+        self._words = []
+        self._names = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _split(name):
+        return name.lower().split()
+
+    def add(self, player_id, name):
+        with self._lock:
+            self._names[player_id] = name
+            for word in self._split(name):
+                bisect.insort(self._words, (word, player_id))
+
+    def search(self, query, limit=20):
+        '''
+        returns:
+            player_ids whose names match every word of the query (as a
+            prefix of some word in the name), best matches first
+        '''
+        words = self._split(query)
+        if not words:
+            return []
+        matches = None
+        for word in words:
+            ids = set(self._prefix(word))
+            matches = ids if matches is None else matches & ids
+        if not matches:
+            matches = self._fuzzy(words[-1])
+        # names starting with the query first, then alphabetical
+        query = query.lower().strip()
+        ranked = sorted(
+            matches,
+            key=lambda pid: (not self._names[pid].lower().startswith(query), self._names[pid].lower())
+        )
+        return ranked[:limit]
+
+    def _prefix(self, prefix):
+        i = bisect.bisect_left(self._words, (prefix,))
+        while i < len(self._words) and self._words[i][0].startswith(prefix):
+            yield self._words[i][1]
+            i += 1
+
+    def _fuzzy(self, word):
+        vocabulary = sorted(set(w for w, _ in self._words))
+        close = difflib.get_close_matches(word, vocabulary, n=5, cutoff=.7)
+        matches = set()
+        for c in close:
+            matches.update(self._prefix(c))
+        return matches
+
+    @staticmethod
+    def from_rows(player_rows):
+        index = PlayerNameIndex()
+        pairs = []
+        for p in player_rows:
+            index._names[p['player_id']] = p['name']
+            pairs.extend((word, p['player_id']) for word in PlayerNameIndex._split(p['name']))
+        index._words = sorted(pairs)
+        return index
+
+
+class RatingIndex():
+    '''
+    players kept sorted by rating so "who is rated closest to X" is a
+    bisect and a walk outwards instead of a sort of the whole league
+    '''
+    def __init__(self):
+        # sorted (rating, player_id)
+        self._entries = []
+        self._ratings = {}
+        self._lock = threading.Lock()
+
+    def update(self, player_id, rating):
+        # also adds players not in the index yet
+        with self._lock:
+            old = self._ratings.get(player_id)
+            if old is not None:
+                i = bisect.bisect_left(self._entries, (old, player_id))
+                del self._entries[i]
+            self._ratings[player_id] = rating
+            bisect.insort(self._entries, (rating, player_id))
+
+    def nearest(self, player_id, k=5, exclude=()):
+        '''
+        returns:
+            up to k (player_id, rating) pairs closest in rating to the
+            player, skipping the player and anyone in exclude
+        '''
+        with self._lock:
+            rating = self._ratings.get(player_id)
+            if rating is None:
+                return []
+            entries = self._entries
+            i = bisect.bisect_left(entries, (rating, player_id))
+            below = i - 1
+            above = i + 1
+            found = []
+            while len(found) < k and (below >= 0 or above < len(entries)):
+                take_below = above >= len(entries) or (
+                    below >= 0 and rating - entries[below][0] <= entries[above][0] - rating
+                )
+                if take_below:
+                    candidate = entries[below]
+                    below -= 1
+                else:
+                    candidate = entries[above]
+                    above += 1
+                if candidate[1] not in exclude:
+                    found.append((candidate[1], candidate[0]))
+            return found
+
+    @staticmethod
+    def from_rows(player_rows):
+        index = RatingIndex()
+        index._ratings = {p['player_id']: p['rating'] or 0 for p in player_rows}
+        index._entries = sorted((r, pid) for pid, r in index._ratings.items())
+        return index
@@ -0,0 +1,93 @@
+
+import json
+import queue
+import threading
+
+
+def format_event(event, data):
+    return 'event: {}\ndata: {}\n\n'.format(event, json.dumps(data))
+
+
+class Broadcaster():
+    '''
+    in process publish / subscribe for server-sent events. every
+    subscriber gets its own queue, publish formats the message once and
+    hands the same string to each of them.
+
+    only reaches clients connected to the same process, so run gunicorn
+    with a single (threaded) worker, see gunicorn.conf.py. each open
+    stream holds one of that worker's threads, so at most max_streams
+    are allowed at once (None for no limit)
+    '''
+    def __init__(self, max_queued=100, heartbeat=15, max_streams=None):
+        self.max_queued = max_queued
+        self.heartbeat = heartbeat
+        self.max_streams = max_streams
+        self._subscribers = {}
+        self._num_subscribers = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        '''
+        returns:
+            queue for the new subscriber, None when max_streams are open
+        '''
+        q = queue.Queue(maxsize=self.max_queued)
+        with self._lock:
+            if self.max_streams is not None and self._num_subscribers >= self.max_streams:
+                return None
+            self._subscribers.setdefault(channel, set()).add(q)
+            self._num_subscribers += 1
+        return q
+
+    def unsubscribe(self, channel, q):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is None or q not in subscribers:
+                return
+            subscribers.discard(q)
+            self._num_subscribers -= 1
+            if not subscribers:
+                del self._subscribers[channel]
+
+    def has_subscribers(self, channel):
+        return channel in self._subscribers
+
+    def publish(self, channel, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        if not subscribers:
+            return
+        message = format_event(event, data)
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # client stopped reading, drop it rather than block the write
+                self.unsubscribe(channel, q)
+
+    def stream(self, channel):
+        '''
+        generator of raw event-stream text for one client, None when
+        max_streams clients are already connected
+        '''
+        q = self.subscribe(channel)
+        if q is None:
+            return None
+        return self._events(channel, q)
+
+    def _events(self, channel, q):
+        try:
+            yield ': connected\n\n'
+            while True:
+                # dropped for falling behind, end the stream so the
+                # browser reconnects and reloads the page state
+                if q not in self._subscribers.get(channel, ()):
+                    return
+                try:
+                    yield q.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    # comment line keeps proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe(channel, q)
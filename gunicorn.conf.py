@@ -0,0 +1,23 @@
+# picked up automatically by `gunicorn app:app` (see Procfile)
+import os
+
+# load the app once in the master and fork workers from it, so
+# workers start with everything already imported
+preload_app = os.environ.get('PRELOAD_APP', '1') == '1'
+
+# exactly one worker: the live scoreboard fans out updates in process
+# (events.Broadcaster) and the standings / ledger caches in app.py are only
+# kept current by writes made through the same process. a second worker
+# would serve stale standings and provisional ratings.
+workers = 1
+# each open scoreboard stream holds a thread, app.config['MAX_STREAMS']
+# caps them below this so normal requests always have threads left
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+
+
+def when_ready(server):
+    # runs in the master before any workers are forked
+    if preload_app and os.environ.get('PREWARM_IMPORTS', '1') == '1':
+        from app import warm_imports
+        warm_imports()
@@ -0,0 +1,105 @@
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def collapse_stack(frame):
+    '''
+    frame -> 'outermost;...;innermost' in the collapsed format flamegraph.pl
+    and speedscope read
+    '''
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+
+class Sampler():
+    '''
+    low overhead sampling profiler for requests. one background thread
+    wakes every `interval` seconds and records the stack of each thread
+    that is currently serving a profiled request, counted per route.
+    nothing runs (the thread just waits) while no profiled request is
+    in flight
+    '''
+    def __init__(self, output_dir, interval=.005, flush_interval=10.):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.flush_interval = flush_interval
+        # thread ident -> route being served
+        self._active = {}
+        # route -> Counter of collapsed stack -> samples
+        self._stacks = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_flush = time.time()
+
+    def _ensure_thread(self):
+        # started lazily so it is created in the worker, not a preloading master
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+            self._thread.start()
+
+    def start_request(self, route):
+        with self._lock:
+            self._ensure_thread()
+            self._active[threading.get_ident()] = route
+        self._wake.set()
+
+    def is_profiling(self):
+        # is the current thread serving a profiled request
+        return threading.get_ident() in self._active
+
+    def end_request(self):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+            flush = time.time() - self._last_flush > self.flush_interval
+        if flush:
+            self.flush()
+
+    def _run(self):
+        while True:
+            if not self._active:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+            frames = sys._current_frames()
+            for ident, route in active:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = collapse_stack(frame)
+                with self._lock:
+                    self._stacks.setdefault(route, Counter())[stack] += 1
+
+    @staticmethod
+    def _file_name(route):
+        return re.sub(r'[^A-Za-z0-9_.-]+', '_', route).strip('_') or 'root'
+
+    def flush(self):
+        '''
+        write one <route>.folded file per route (cumulative counts). turn
+        into a flamegraph with e.g. flamegraph.pl route.folded > route.svg
+        '''
+        with self._lock:
+            stacks = {route: Counter(counts) for route, counts in self._stacks.items()}
+            self._last_flush = time.time()
+        if not stacks:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        for route, counts in stacks.items():
+            path = os.path.join(self.output_dir, self._file_name(route) + '.folded')
+            with open(path, 'w') as f:
+                for stack, count in counts.most_common():
+                    f.write('{} {}\n'.format(stack, count))
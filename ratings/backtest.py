@@ -0,0 +1,133 @@
+'''
+replay a league's match history under a rating model and score how well
+the ratings predicted each result
+
+usage (from the repo root):
+    python -m ratings.backtest data/<league>.db [model ...]
+'''
+import sys
+import time
+
+import numpy as np
+
+from ratings.ratings import RATING_MODELS, get_rating_model
+
+
+class MatchHistory():
+    '''
+    a league's played matches as flat arrays (one entry per match, oldest
+    session first) with players mapped to positions in `initial_ratings`
+    '''
+    def __init__(self, player_ids, initial_ratings, session_ids, p1, p2, w1, w2):
+        self.player_ids = player_ids
+        self.initial_ratings = initial_ratings
+        self.session_ids = session_ids
+        self.p1 = p1
+        self.p2 = p2
+        self.w1 = w1
+        self.w2 = w2
+        # start / end offsets of each session's block of matches
+        changes = np.flatnonzero(np.diff(session_ids)) + 1
+        self.session_bounds = np.concatenate(([0], changes, [len(session_ids)]))
+
+    @property
+    def num_matches(self):
+        return len(self.session_ids)
+
+    @staticmethod
+    def from_db(db):
+        rating_rows = db.get_initial_ratings()
+        player_ids = np.array([r['player_id'] for r in rating_rows])
+        initial_ratings = np.array([r['rating'] or 0 for r in rating_rows], dtype=float)
+        position = {pid: i for i, pid in enumerate(player_ids.tolist())}
+
+        match_rows = db.get_match_history()
+        return MatchHistory(
+            player_ids,
+            initial_ratings,
+            np.array([m['session_id'] for m in match_rows], dtype=np.int64),
+            np.array([position[m['player_1_id']] for m in match_rows], dtype=np.int64),
+            np.array([position[m['player_2_id']] for m in match_rows], dtype=np.int64),
+            np.array([m['player_1_wins'] for m in match_rows], dtype=float),
+            np.array([m['player_2_wins'] for m in match_rows], dtype=float),
+        )
+
+
+def replay(history, model):
+    '''
+    ratings move once per session (every match in a session is rated off
+    the ratings players came in with, same as session_results), so each
+    session is one vectorized step
+
+    returns:
+        (final ratings array, player 1 win probability for every match,
+         player 1 / player 2 rating going into every match)
+    '''
+    ratings = history.initial_ratings.copy()
+    n = history.num_matches
+    probabilities = np.empty(n)
+    r1_before = np.empty(n)
+    r2_before = np.empty(n)
+    bounds = history.session_bounds
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        p1 = history.p1[start:end]
+        p2 = history.p2[start:end]
+        w1 = history.w1[start:end]
+        w2 = history.w2[start:end]
+        r1 = ratings[p1]
+        r2 = ratings[p2]
+        r1_before[start:end] = r1
+        r2_before[start:end] = r2
+        probabilities[start:end] = model.win_probability(r1, r2)
+        np.add.at(ratings, p1, model.adjustments(r1, w1, r2, w2))
+        np.add.at(ratings, p2, model.adjustments(r2, w2, r1, w1))
+    return ratings, probabilities, r1_before, r2_before
+
+
+def score(history, model):
+    '''
+    returns:
+        dict of predictive accuracy stats for the model over the history
+    '''
+    _, probabilities, r1, r2 = replay(history, model)
+    decided = history.w1 != history.w2
+    p1_won = (history.w1 > history.w2)[decided]
+    p = np.clip(probabilities[decided], 1e-9, 1 - 1e-9)
+    r1 = r1[decided]
+    r2 = r2[decided]
+    unequal = r1 != r2
+    underdog_won = unequal & ((r1 < r2) == p1_won)
+    num = int(decided.sum())
+    if num == 0:
+        return {'matches': 0, 'log_loss': None, 'accuracy': None, 'upset_rate': None}
+    return {
+        'matches': num,
+        'log_loss': float(-np.mean(np.where(p1_won, np.log(p), np.log(1 - p)))),
+        'accuracy': float(np.mean((p > .5) == p1_won)),
+        'upset_rate': float(underdog_won.sum() / max(unequal.sum(), 1)),
+    }
+
+
+if __name__ == '__main__':
+    from data_access.data_access import DataAccess
+
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    db = DataAccess(sys.argv[1])
+    db.connect()
+    history = MatchHistory.from_db(db)
+    db.close()
+
+    names = sys.argv[2:] or sorted(RATING_MODELS)
+    print('{} matches, {} players'.format(history.num_matches, len(history.player_ids)))
+    for name in names:
+        model = get_rating_model(name)
+        start = time.perf_counter()
+        stats = score(history, model)
+        elapsed = time.perf_counter() - start
+        if not stats['matches']:
+            print('no played matches')
+            break
+        print('{:<8} log loss {:.4f}  accuracy {:.3f}  upset rate {:.3f}  ({:.2f}s)'.format(
+            name, stats['log_loss'], stats['accuracy'], stats['upset_rate'], elapsed))
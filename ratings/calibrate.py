@@ -0,0 +1,139 @@
+'''
+grid search the BTTC constants over a league's history
+
+each parameter set is scored with the vectorized backtest replay, spread
+over a process pool. prints the best configuration plus the error surface
+over base points x difference factor, and optionally writes every result
+to csv
+
+usage (from the repo root):
+    python -m ratings.calibrate data/<league>.db [--csv out.csv] [--workers N]
+        [--base-points 8:32:2] [--difference-factor 0.01:0.08:0.005]
+        [--game-points 0:4:1] [--metric log_loss]
+'''
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ratings.backtest import MatchHistory, score
+from ratings.ratings import BTTCModel
+
+PARAM_NAMES = ['base_points', 'difference_factor', 'game_points']
+
+# set in each worker by _init_worker so the history is only sent over once
+_history = None
+
+
+def _init_worker(history):
+    global _history
+    _history = history
+
+
+def _score_params(params):
+    model = BTTCModel(**dict(zip(PARAM_NAMES, params)))
+    return params, score(_history, model)
+
+
+def parse_range(text):
+    '''
+    'start:stop:step' (stop inclusive) or a comma separated list
+    '''
+    if ':' in text:
+        start, stop, step = (float(x) for x in text.split(':'))
+        # small nudge so float steps still include stop
+        return [round(x, 6) for x in np.arange(start, stop + step / 2., step)]
+    return [float(x) for x in text.split(',')]
+
+
+def calibrate(history, grid, workers=None):
+    '''
+    args:
+        history MatchHistory
+        grid dict of param name -> list of values
+    returns:
+        list of (params tuple, stats dict) in grid order
+    '''
+    combos = list(itertools.product(*(grid[name] for name in PARAM_NAMES)))
+    workers = workers or os.cpu_count()
+    # a few big chunks per worker keeps pickling overhead down
+    chunksize = max(1, len(combos) // (workers * 4))
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(history,)
+    ) as pool:
+        return list(pool.map(_score_params, combos, chunksize=chunksize))
+
+
+def print_surface(results, grid, metric):
+    # best value over game_points for each base_points / difference_factor cell
+    best = {}
+    for params, stats in results:
+        cell = (params[0], params[1])
+        value = stats[metric]
+        if cell not in best or value < best[cell]:
+            best[cell] = value
+    factors = grid['difference_factor']
+    print('{} by base_points (rows) x difference_factor (cols), best over game_points'.format(metric))
+    print('{:>8} '.format('') + ' '.join('{:>7}'.format(f) for f in factors))
+    for base_points in grid['base_points']:
+        row = ['{:>7.4f}'.format(best[(base_points, f)]) for f in factors]
+        print('{:>8} '.format(base_points) + ' '.join(row))
+
+
+if __name__ == '__main__':
+    from data_access.data_access import DataAccess
+
+    parser = argparse.ArgumentParser(description='calibrate BTTC constants')
+    parser.add_argument('db_path')
+    parser.add_argument('--base-points', default='8:32:2')
+    parser.add_argument('--difference-factor', default='0.01:0.08:0.005')
+    parser.add_argument('--game-points', default='0:4:1')
+    parser.add_argument('--metric', default='log_loss', choices=['log_loss', 'upset_rate'])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--csv', default=None)
+    args = parser.parse_args()
+
+    db = DataAccess(args.db_path)
+    db.connect()
+    history = MatchHistory.from_db(db)
+    db.close()
+    if history.num_matches == 0:
+        print('no played matches')
+        sys.exit(1)
+
+    grid = {
+        'base_points': parse_range(args.base_points),
+        'difference_factor': parse_range(args.difference_factor),
+        'game_points': parse_range(args.game_points),
+    }
+    num_combos = len(grid['base_points']) * len(grid['difference_factor']) * len(grid['game_points'])
+    print('{} matches, {} parameter sets'.format(history.num_matches, num_combos))
+
+    start = time.perf_counter()
+    results = calibrate(history, grid, workers=args.workers)
+    elapsed = time.perf_counter() - start
+
+    best_params, best_stats = min(results, key=lambda r: r[1][args.metric])
+    default_stats = score(history, BTTCModel())
+    print('took {:.1f}s'.format(elapsed))
+    print('best: {}'.format(BTTCModel(**dict(zip(PARAM_NAMES, best_params)))))
+    print('  log loss {:.4f}  accuracy {:.3f}  upset rate {:.3f}'.format(
+        best_stats['log_loss'], best_stats['accuracy'], best_stats['upset_rate']))
+    print('current: {}'.format(BTTCModel()))
+    print('  log loss {:.4f}  accuracy {:.3f}  upset rate {:.3f}'.format(
+        default_stats['log_loss'], default_stats['accuracy'], default_stats['upset_rate']))
+    print_surface(results, grid, args.metric)
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(PARAM_NAMES + ['log_loss', 'accuracy', 'upset_rate'])
+            for params, stats in results:
+                writer.writerow(list(params) + [stats['log_loss'], stats['accuracy'], stats['upset_rate']])
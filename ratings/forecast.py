@@ -0,0 +1,139 @@
+
+from functools import lru_cache
+
+import numpy as np
+
+from ratings.groupings import Group, Player
+from ratings.ratings import get_rating_model
+from ratings.standings import GroupStandings
+
+GAMES_TO_WIN = 3 # best of five
+DEFAULT_TRIALS = 20000
+
+
+def game_win_probability(rating, player_2_rating, scale):
+    # per game edge is smaller than the per match edge, hence the wider scale
+    return 1. / (1. + 10. ** ((player_2_rating - rating) / scale))
+
+
+def simulate_group(group, model, trials=DEFAULT_TRIALS, game_scale=None, seed=0):
+    '''
+    play every match in the group `trials` times, game by game
+
+    group winners are decided by the same rule as standings.GroupStandings:
+    match wins, a two way tie goes to the head to head winner (done for
+    all trials at once), bigger ties go through GroupStandings itself
+
+    returns:
+        list of dicts (one per player, in group order) with the chance of
+        winning the group and the rating change distribution
+    '''
+    rng = np.random.default_rng(seed)
+    game_scale = game_scale or 2 * model.scale
+    players = group.players
+    position = {p.player_id: i for i, p in enumerate(players)}
+    pairs = group.make_matches()
+    num_players = len(players)
+    num_matches = len(pairs)
+    if num_matches == 0:
+        return [
+            {'player_id': p.player_id, 'win_group': 1. if num_players == 1 else 0.,
+             'expected_change': 0., 'change_low': 0., 'change_high': 0.}
+            for p in players
+        ]
+
+    i1 = np.array([position[a.player_id] for a, _ in pairs])
+    i2 = np.array([position[b.player_id] for _, b in pairs])
+    ratings = np.array([float(p.rating) for p in players])
+    r1 = ratings[i1]
+    r2 = ratings[i2]
+
+    # (trials, matches, games) - play all five games, then cut each match
+    # off at the game where someone reached three
+    p_game = game_win_probability(r1, r2, game_scale)
+    games = rng.random((trials, num_matches, 2 * GAMES_TO_WIN - 1)) < p_game[None, :, None]
+    c1 = games.cumsum(axis=2)
+    c2 = (~games).cumsum(axis=2)
+    decided = (c1 == GAMES_TO_WIN) | (c2 == GAMES_TO_WIN)
+    last_game = decided.argmax(axis=2)[..., None]
+    w1 = np.take_along_axis(c1, last_game, axis=2)[..., 0].astype(float)
+    w2 = np.take_along_axis(c2, last_game, axis=2)[..., 0].astype(float)
+
+    # match -> player incidence, so per player totals are matrix products
+    side1 = np.zeros((num_matches, num_players))
+    side2 = np.zeros((num_matches, num_players))
+    side1[np.arange(num_matches), i1] = 1
+    side2[np.arange(num_matches), i2] = 1
+
+    p1_won = w1 > w2
+    match_wins = p1_won.astype(float) @ side1 + (~p1_won).astype(float) @ side2
+    winners = group_winners(players, pairs, i1, i2, w1, w2, p1_won, match_wins)
+    win_group = np.bincount(winners, minlength=num_players) / float(trials)
+
+    r1_trials = np.broadcast_to(r1, w1.shape)
+    r2_trials = np.broadcast_to(r2, w1.shape)
+    d1 = model.adjustments(r1_trials, w1, r2_trials, w2)
+    d2 = model.adjustments(r2_trials, w2, r1_trials, w1)
+    change = d1 @ side1 + d2 @ side2
+    low, high = np.percentile(change, [10, 90], axis=0)
+    expected = change.mean(axis=0)
+
+    return [
+        {
+            'player_id': p.player_id,
+            'win_group': float(win_group[i]),
+            'expected_change': float(expected[i]),
+            'change_low': float(low[i]),
+            'change_high': float(high[i]),
+        }
+        for i, p in enumerate(players)
+    ]
+
+
+def group_winners(players, pairs, i1, i2, w1, w2, p1_won, match_wins):
+    '''
+    returns:
+        position (in group order) of each trial's group winner
+    '''
+    num_players = len(players)
+    # every simulated match has a winner, so one player on top is the winner,
+    # two tied on top are split by their match, more need the mini table
+    top = match_wins == match_wins.max(axis=1)[:, None]
+    num_top = top.sum(axis=1)
+    winners = top.argmax(axis=1)
+
+    two = np.flatnonzero(num_top == 2)
+    if len(two):
+        a = top[two].argmax(axis=1)
+        b = num_players - 1 - top[two, ::-1].argmax(axis=1)
+        # (a, b) -> index of their match
+        match_index = np.zeros((num_players, num_players), dtype=int)
+        match_index[i1, i2] = np.arange(len(pairs))
+        match_index[i2, i1] = np.arange(len(pairs))
+        m = match_index[a, b]
+        a_won = p1_won[two, m] == (i1[m] == a)
+        winners[two] = np.where(a_won, a, b)
+
+    position = {p.player_id: i for i, p in enumerate(players)}
+    for t in np.flatnonzero(num_top > 2):
+        standings = GroupStandings(0)
+        for m, (p1, p2) in enumerate(pairs):
+            standings.record_result(p1.player_id, p2.player_id, int(w1[t, m]), int(w2[t, m]))
+        winners[t] = position[standings.winner]
+    return winners
+
+
+@lru_cache(maxsize=256)
+def _forecast_roster(roster, model_name, trials):
+    group = Group(0, [Player(pid, name, rating) for pid, name, rating in roster])
+    return simulate_group(group, get_rating_model(model_name), trials=trials)
+
+
+def forecast_group(group, model_name, trials=DEFAULT_TRIALS):
+    '''
+    simulate_group results keyed by player_id, cached per roster (same
+    players at the same ratings in the same order) and rating model
+    '''
+    roster = tuple((p.player_id, p.name, p.rating) for p in group.players)
+    results = _forecast_roster(roster, model_name, trials)
+    return {r['player_id']: r for r in results}
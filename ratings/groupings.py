@@ -1,7 +1,6 @@
 import json
-from k_means_constrained import KMeansConstrained
-import numpy as np
 import itertools
+from ratings.standings import GroupStandings
 
 
 class Player(): 
@@ -96,6 +95,7 @@ class GroupResult():
         self.group_number = group_number
         self.matches = matches
         self.players = players
+        self.standings = None
 
     @staticmethod
     def from_match_rows(group_num, match_rows):
@@ -116,10 +116,31 @@ class GroupResult():
         return GroupResult(group_num, matches)
 
     def calculate_ranking_in_group(self):
-        pass
+        '''
+        returns:
+            list of PlayerStanding for the group, first place first
+        '''
+        if self.standings is None:
+            self.standings = GroupStandings.from_matches(self.group_number, self.matches)
+        return self.standings.ranking()
+
+    def ranked_players(self):
+        '''
+        returns:
+            list of (Player, PlayerStanding) pairs in finishing order
+        '''
+        players = {}
+        for m in self.matches:
+            players[m.player1.player_id] = m.player1
+            players[m.player2.player_id] = m.player2
+        return [(players[s.player_id], s) for s in self.calculate_ranking_in_group()]
 
 
 def make_groups(players, num_groups, min_per_group=None, max_per_group=None):
+    # numpy / k-means are slow to import, only load them when grouping
+    import numpy as np
+    from k_means_constrained import KMeansConstrained
+
     # sort ratings high to low
     sorted_players = sorted(players, key=lambda p: -p.rating)
     num_players = len(sorted_players)
@@ -0,0 +1,97 @@
+
+import threading
+
+
+class ProvisionalRatings():
+    '''
+    running rating changes for a session that hasn't been finalized.
+
+    every match in a session is rated off the ratings players came in with,
+    so each match's adjustment is independent of the others. that means a
+    new score just adds its adjustment and a corrected score takes the old
+    adjustment back out first - O(1) per score, no replay of the session
+    '''
+    def __init__(self, model, start_ratings):
+        '''
+        args:
+            model RatingModel
+            start_ratings dict of player_id -> rating coming into the session
+        '''
+        self.model = model
+        self.start_ratings = dict(start_ratings)
+        self.deltas = dict.fromkeys(self.start_ratings, 0)
+        # (low player_id, high player_id) -> (low player adjustment, high player adjustment)
+        self.adjustments = {}
+
+    def _add(self, key, adjustment, sign):
+        a, b = key
+        self.deltas[a] += sign * adjustment[0]
+        self.deltas[b] += sign * adjustment[1]
+
+    def record_result(self, p1_id, p2_id, p1_wins, p2_wins):
+        if p2_id < p1_id:
+            p1_id, p2_id, p1_wins, p2_wins = p2_id, p1_id, p2_wins, p1_wins
+        key = (p1_id, p2_id)
+        old = self.adjustments.pop(key, None)
+        if old is not None:
+            self._add(key, old, -1)
+        if p1_wins is None or p2_wins is None:
+            return
+        r1 = self.start_ratings[p1_id]
+        r2 = self.start_ratings[p2_id]
+        adjustment = (
+            self.model.adjustment(r1, p1_wins, r2, p2_wins),
+            self.model.adjustment(r2, p2_wins, r1, p1_wins),
+        )
+        self.adjustments[key] = adjustment
+        self._add(key, adjustment, 1)
+
+    def rating(self, player_id):
+        return self.start_ratings[player_id] + self.deltas[player_id]
+
+    def ratings(self):
+        return {pid: self.rating(pid) for pid in self.start_ratings}
+
+    @staticmethod
+    def from_match_rows(model, start_ratings, match_rows):
+        ledger = ProvisionalRatings(model, start_ratings)
+        for m in match_rows:
+            ledger.record_result(
+                m['player_1_id'],
+                m['player_2_id'],
+                m['player_1_wins'],
+                m['player_2_wins']
+            )
+        return ledger
+
+
+class LedgerCache():
+    '''
+    process wide ProvisionalRatings per (league, session), same idea as
+    standings.StandingsCache
+    '''
+    def __init__(self):
+        self._ledgers = {}
+        self._lock = threading.Lock()
+
+    def get(self, league, session_id, load):
+        key = (league, int(session_id))
+        ledger = self._ledgers.get(key)
+        if ledger is None:
+            # load under the lock so a record_result can't slip in between
+            # reading the rows and caching the ledger
+            with self._lock:
+                ledger = self._ledgers.get(key)
+                if ledger is None:
+                    ledger = self._ledgers[key] = load()
+        return ledger
+
+    def record_result(self, league, session_id, p1_id, p2_id, p1_wins, p2_wins):
+        with self._lock:
+            ledger = self._ledgers.get((league, int(session_id)))
+            if ledger is not None:
+                ledger.record_result(int(p1_id), int(p2_id), p1_wins, p2_wins)
+
+    def invalidate(self, league, session_id):
+        with self._lock:
+            self._ledgers.pop((league, int(session_id)), None)
@@ -1,8 +1,39 @@
 
 
+# USATT point exchange table: (largest rating difference, points for the
+# expected result, points for an upset)
+# https://www.teamusa.org/usa-table-tennis/ratings/rating-system
+USATT_POINT_TABLE = [
+    (12, 8, 8),
+    (37, 7, 10),
+    (62, 6, 13),
+    (87, 5, 16),
+    (112, 4, 20),
+    (137, 3, 25),
+    (162, 2, 30),
+    (187, 2, 35),
+    (212, 1, 40),
+    (237, 1, 45),
+    (None, 0, 50),
+]
+
+
 def usatt_algorithm(rating, wins, player_2_rating, player_2_wins):
-    # should use this: https://www.teamusa.org/usa-table-tennis/ratings/rating-system
-    pass
+    '''
+    same args / return as bttc_algorithm, using the USATT point exchange table
+    '''
+    if wins is None or player_2_wins is None or wins == player_2_wins:
+        return 0
+
+    rating_difference = abs(rating - player_2_rating)
+    for max_difference, expected, upset in USATT_POINT_TABLE:
+        if max_difference is None or rating_difference <= max_difference:
+            break
+
+    won_match = wins > player_2_wins
+    if won_match:
+        return expected if rating >= player_2_rating else upset
+    return -expected if player_2_rating >= rating else -upset
 
 # From BTTC methodology:
 # 16 points to a 3-0 winner over an equally rated opponent. 
@@ -21,18 +52,21 @@ def usatt_algorithm(rating, wins, player_2_rating, player_2_wins):
 # 1400 --> 1400 + (16 + .04 * (1600 - 1400)) 
 # 1600 --> 1600 - (16 + .04 * (1600 - 1400))
 
-def bttc_algorithm(rating, wins, player_2_rating, player_2_wins):
+def bttc_algorithm(rating, wins, player_2_rating, player_2_wins,
+                   base_points=16, difference_factor=.04, game_points=2):
     '''
     args:
         rating1 int
         player_1_wins int (number of wins for player 1)
         rating2 int
         player_2_wins int (number of wins for player 2)
+        base_points, difference_factor, game_points: the BTTC constants
+            (16 points, 4% of the difference, 2 points a game)
     returns:
         rating adjustment (signed int)
     '''
     # draw, or not entered etc.
-    if wins == player_2_wins:
+    if wins is None or player_2_wins is None or wins == player_2_wins:
         return 0
     
     rating_difference = abs(rating - player_2_rating)
@@ -41,29 +75,185 @@ def bttc_algorithm(rating, wins, player_2_rating, player_2_wins):
     if wins < player_2_wins:
         won_match = False
     # adjustments
-    adjustment_factor = int(round(.04 * rating_difference, 0)) # 4% adjustment per BTTC
+    adjustment_factor = int(round(difference_factor * rating_difference, 0)) # 4% adjustment per BTTC
     # adjust scores
     if won_match:
         # this is expected result, adjust downward
         if rating > player_2_rating:
-            adjustment = max(16 - adjustment_factor, 0) - (2 * player_2_wins)
+            adjustment = max(base_points - adjustment_factor, 0) - (game_points * player_2_wins)
         # this is an upset, adjust upward
         else: 
-            adjustment = 16 + adjustment_factor - (2 * player_2_wins)
+            adjustment = base_points + adjustment_factor - (game_points * player_2_wins)
 
     else:
         # lost but this is expected
         if player_2_rating > rating:
             # if adjustment factor > 16 no change
-            adjustment = -1 * max((16 - adjustment_factor), 0) + (2 * wins)
+            adjustment = -1 * max((base_points - adjustment_factor), 0) + (game_points * wins)
         # lost, and it's an upset
         else: 
-            adjustment = -1 * (16 + adjustment_factor) + (2 * wins)
+            adjustment = -1 * (base_points + adjustment_factor) + (game_points * wins)
 
     return adjustment
 
 
+#### RATING MODELS
+# common interface so the app / backtester don't care which rules are in use.
+# the array versions take numpy arrays (one entry per match) and are what
+# the backtester uses; numpy is imported on demand since it's slow to load
+
+class RatingModel():
+    name = None
+    # logistic scale for win probabilities: a player rated `scale` points
+    # above their opponent is a 10 to 1 favourite
+    scale = 400.
+
+    def adjustment(self, rating, wins, player_2_rating, player_2_wins):
+        raise NotImplementedError
+
+    def adjustments(self, ratings, wins, player_2_ratings, player_2_wins):
+        import numpy as np
+        return np.array([
+            self.adjustment(r1, w1, r2, w2)
+            for r1, w1, r2, w2 in zip(ratings, wins, player_2_ratings, player_2_wins)
+        ], dtype=float)
+
+    def win_probability(self, rating, player_2_rating):
+        '''
+        chance player 1 wins the match, works on scalars or arrays
+        '''
+        return 1. / (1. + 10. ** ((player_2_rating - rating) / self.scale))
+
+    @property
+    def params(self):
+        return {}
+
+    def __repr__(self):
+        params = ', '.join('{}={}'.format(k, v) for k, v in self.params.items())
+        return '{}({})'.format(self.__class__.__name__, params)
+
+
+class BTTCModel(RatingModel):
+    name = 'bttc'
+
+    def __init__(self, base_points=16, difference_factor=.04, game_points=2):
+        self.base_points = base_points
+        self.difference_factor = difference_factor
+        self.game_points = game_points
+
+    @property
+    def params(self):
+        return {
+            'base_points': self.base_points,
+            'difference_factor': self.difference_factor,
+            'game_points': self.game_points,
+        }
+
+    def adjustment(self, rating, wins, player_2_rating, player_2_wins):
+        return bttc_algorithm(rating, wins, player_2_rating, player_2_wins, **self.params)
+
+    def adjustments(self, ratings, wins, player_2_ratings, player_2_wins):
+        import numpy as np
+        factor = np.round(self.difference_factor * np.abs(ratings - player_2_ratings))
+        favourite = ratings > player_2_ratings
+        underdog = player_2_ratings > ratings
+        expected = np.maximum(self.base_points - factor, 0)
+        upset = self.base_points + factor
+        won = np.where(favourite, expected, upset) - self.game_points * player_2_wins
+        lost = -np.where(underdog, expected, upset) + self.game_points * wins
+        return np.select([wins > player_2_wins, wins < player_2_wins], [won, lost], 0.)
+
+
+class USATTModel(RatingModel):
+    name = 'usatt'
+
+    def adjustment(self, rating, wins, player_2_rating, player_2_wins):
+        return usatt_algorithm(rating, wins, player_2_rating, player_2_wins)
+
+    def adjustments(self, ratings, wins, player_2_ratings, player_2_wins):
+        import numpy as np
+        bounds = np.array([row[0] for row in USATT_POINT_TABLE[:-1]])
+        expected = np.array([row[1] for row in USATT_POINT_TABLE], dtype=float)
+        upset = np.array([row[2] for row in USATT_POINT_TABLE], dtype=float)
+        idx = np.searchsorted(bounds, np.abs(ratings - player_2_ratings), side='left')
+        won = np.where(ratings >= player_2_ratings, expected[idx], upset[idx])
+        lost = -np.where(player_2_ratings >= ratings, expected[idx], upset[idx])
+        return np.select([wins > player_2_wins, wins < player_2_wins], [won, lost], 0.)
+
+
+class EloModel(RatingModel):
+    name = 'elo'
+
+    def __init__(self, k=32, scale=400.):
+        self.k = k
+        self.scale = scale
+
+    @property
+    def params(self):
+        return {'k': self.k, 'scale': self.scale}
+
+    def adjustment(self, rating, wins, player_2_rating, player_2_wins):
+        if wins is None or player_2_wins is None or wins == player_2_wins:
+            return 0
+        score = 1. if wins > player_2_wins else 0.
+        expected = self.win_probability(rating, player_2_rating)
+        return int(round(self.k * (score - expected)))
+
+    def adjustments(self, ratings, wins, player_2_ratings, player_2_wins):
+        import numpy as np
+        score = (wins > player_2_wins).astype(float)
+        change = np.round(self.k * (score - self.win_probability(ratings, player_2_ratings)))
+        return np.where(wins == player_2_wins, 0., change)
+
+
+RATING_MODELS = {
+    BTTCModel.name: BTTCModel,
+    USATTModel.name: USATTModel,
+    EloModel.name: EloModel,
+}
+
+
+def get_rating_model(name, **params):
+    try:
+        model_class = RATING_MODELS[name]
+    except KeyError:
+        raise ValueError('unknown rating model: {}'.format(name))
+    return model_class(**params)
+
+
+def check_adjustments(model, num_matches=20000, seed=0):
+    '''
+    run the array version of the model against the scalar one on random
+    matches (any score 0-3 a side, including ties and unplayed 0-0)
+
+    returns:
+        number of matches where the two disagree
+    '''
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    ratings = rng.integers(100, 3000, num_matches)
+    player_2_ratings = rng.integers(100, 3000, num_matches)
+    wins = rng.integers(0, 4, num_matches)
+    player_2_wins = rng.integers(0, 4, num_matches)
+    vectorized = model.adjustments(
+        ratings.astype(float), wins.astype(float),
+        player_2_ratings.astype(float), player_2_wins.astype(float))
+    mismatches = 0
+    for i in range(num_matches):
+        scalar = model.adjustment(
+            int(ratings[i]), int(wins[i]), int(player_2_ratings[i]), int(player_2_wins[i]))
+        if scalar != vectorized[i]:
+            mismatches += 1
+    return mismatches
+
+
 if __name__ == '__main__':
+    # vectorized models (backtest / forecast) have to agree with the scalar rules
+    for name in sorted(RATING_MODELS):
+        mismatches = check_adjustments(get_rating_model(name))
+        print('{}: {} mismatches in 20000 matches'.format(name, mismatches))
+        assert mismatches == 0
+
     rating1 = 1000
     player_1_wins = 0
     rating2 = 957
@@ -0,0 +1,242 @@
+
+import threading
+
+
+class PlayerStanding():
+    __slots__ = (
+        'player_id',
+        'match_wins',
+        'match_losses',
+        'game_wins',
+        'game_losses',
+    )
+
+    def __init__(self, player_id):
+        self.player_id = player_id
+        self.match_wins = 0
+        self.match_losses = 0
+        self.game_wins = 0
+        self.game_losses = 0
+
+    @property
+    def matches_played(self):
+        return self.match_wins + self.match_losses
+
+    @property
+    def game_ratio(self):
+        if self.game_losses == 0:
+            return float('inf') if self.game_wins else 0.0
+        return float(self.game_wins) / self.game_losses
+
+    def copy(self):
+        standing = PlayerStanding(self.player_id)
+        standing.match_wins = self.match_wins
+        standing.match_losses = self.match_losses
+        standing.game_wins = self.game_wins
+        standing.game_losses = self.game_losses
+        return standing
+
+    def to_dict(self):
+        return {
+            'player_id': self.player_id,
+            'match_wins': self.match_wins,
+            'match_losses': self.match_losses,
+            'game_wins': self.game_wins,
+            'game_losses': self.game_losses,
+        }
+
+
+def _ratio(wins, losses):
+    if losses == 0:
+        return float('inf') if wins else 0.0
+    return float(wins) / losses
+
+
+class GroupStandings():
+    '''
+    running standings for one group. results are keyed by player pair so
+    a corrected score replaces the old one in O(1) (take the old result
+    back out, put the new one in) instead of re-reading the whole group
+
+    ranking order:
+        1. match wins
+        2. among players tied on match wins: match wins between the tied
+           players, then game ratio between the tied players (for two
+           players this is just their head to head)
+        3. overall game ratio
+    '''
+    def __init__(self, group_number):
+        self.group_number = group_number
+        self.standings = {}
+        # (low player_id, high player_id) -> (low player wins, high player wins)
+        self.results = {}
+        self._ranking = None
+
+    def add_player(self, player_id):
+        if player_id not in self.standings:
+            self.standings[player_id] = PlayerStanding(player_id)
+            self._ranking = None
+
+    def _apply(self, key, result, sign):
+        a, b = key
+        wins_a, wins_b = result
+        sa = self.standings[a]
+        sb = self.standings[b]
+        sa.game_wins += sign * wins_a
+        sa.game_losses += sign * wins_b
+        sb.game_wins += sign * wins_b
+        sb.game_losses += sign * wins_a
+        if wins_a > wins_b:
+            sa.match_wins += sign
+            sb.match_losses += sign
+        elif wins_b > wins_a:
+            sb.match_wins += sign
+            sa.match_losses += sign
+
+    def record_result(self, p1_id, p2_id, p1_wins, p2_wins):
+        self.add_player(p1_id)
+        self.add_player(p2_id)
+        if p1_id < p2_id:
+            key, result = (p1_id, p2_id), (p1_wins, p2_wins)
+        else:
+            key, result = (p2_id, p1_id), (p2_wins, p1_wins)
+
+        old = self.results.pop(key, None)
+        if old is not None:
+            self._apply(key, old, -1)
+        # unplayed matches come through with no score
+        if p1_wins is not None and p2_wins is not None:
+            self.results[key] = result
+            self._apply(key, result, 1)
+        self._ranking = None
+
+    def _tiebreak_keys(self, tied):
+        tied_ids = set(p.player_id for p in tied)
+        wins = dict.fromkeys(tied_ids, 0)
+        games_won = dict.fromkeys(tied_ids, 0)
+        games_lost = dict.fromkeys(tied_ids, 0)
+        for (a, b), (wins_a, wins_b) in self.results.items():
+            if a not in tied_ids or b not in tied_ids:
+                continue
+            games_won[a] += wins_a
+            games_lost[a] += wins_b
+            games_won[b] += wins_b
+            games_lost[b] += wins_a
+            if wins_a > wins_b:
+                wins[a] += 1
+            elif wins_b > wins_a:
+                wins[b] += 1
+        return {
+            pid: (wins[pid], _ratio(games_won[pid], games_lost[pid]))
+            for pid in tied_ids
+        }
+
+    def ranking(self):
+        '''
+        returns:
+            list of PlayerStanding, first place first
+        '''
+        if self._ranking is not None:
+            return self._ranking
+
+        by_wins = sorted(self.standings.values(), key=lambda s: -s.match_wins)
+        ranking = []
+        i = 0
+        while i < len(by_wins):
+            j = i
+            while j < len(by_wins) and by_wins[j].match_wins == by_wins[i].match_wins:
+                j += 1
+            tied = by_wins[i:j]
+            if len(tied) > 1:
+                keys = self._tiebreak_keys(tied)
+                tied.sort(key=lambda s: (
+                    -keys[s.player_id][0],
+                    -keys[s.player_id][1],
+                    -s.game_ratio,
+                    s.player_id
+                ))
+            ranking.extend(tied)
+            i = j
+
+        self._ranking = ranking
+        return ranking
+
+    @property
+    def winner(self):
+        '''
+        player_id of the group winner, None until a match has been played
+        '''
+        if not self.results:
+            return None
+        return self.ranking()[0].player_id
+
+    def copy(self):
+        '''
+        independent copy with the ranking already worked out, so it can be
+        read while the original keeps getting patched
+        '''
+        standings = GroupStandings(self.group_number)
+        standings.standings = {pid: s.copy() for pid, s in self.standings.items()}
+        standings.results = dict(self.results)
+        standings._ranking = [standings.standings[s.player_id] for s in self.ranking()]
+        return standings
+
+    @staticmethod
+    def from_matches(group_number, matches):
+        standings = GroupStandings(group_number)
+        for m in matches:
+            standings.record_result(
+                m.player1.player_id,
+                m.player2.player_id,
+                m.p1_wins,
+                m.p2_wins
+            )
+        return standings
+
+
+class StandingsCache():
+    '''
+    process wide cache of GroupStandings keyed by (league, session, group).
+    writes that go through the app either patch the cached standings
+    (record_result) or drop them (invalidate). the cached objects are only
+    touched under the lock, get hands out copies
+    '''
+    def __init__(self):
+        self._standings = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(league, session_id, group_number):
+        return (league, int(session_id), int(group_number))
+
+    def get(self, league, session_id, group_number, load):
+        '''
+        args:
+            load function returning GroupStandings, called on a cache miss
+        '''
+        key = self._key(league, session_id, group_number)
+        # load under the lock: a record_result landing while the rows are
+        # read would otherwise patch nothing and be lost from the cache
+        with self._lock:
+            standings = self._standings.get(key)
+            if standings is None:
+                standings = self._standings[key] = load()
+            # ranked under the lock too, a ranking() racing record_result
+            # could iterate results mid-change or cache a stale order
+            return standings.copy()
+
+    def record_result(self, league, session_id, group_number, p1_id, p2_id, p1_wins, p2_wins):
+        key = self._key(league, session_id, group_number)
+        with self._lock:
+            standings = self._standings.get(key)
+            if standings is not None:
+                standings.record_result(int(p1_id), int(p2_id), p1_wins, p2_wins)
+
+    def invalidate(self, league, session_id, group_number=None):
+        session_id = int(session_id)
+        with self._lock:
+            for key in list(self._standings):
+                if key[0] != league or key[1] != session_id:
+                    continue
+                if group_number is None or key[2] == int(group_number):
+                    del self._standings[key]